@@ -1,74 +1,876 @@
 import sys
 import json
-import tensorflow as tf
-import numpy as np
-from PIL import Image
+import base64
+import binascii
+import argparse
+import glob
+import socketserver
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import os
-import traceback
 
-# Suppress TensorFlow progress bars
-tf.get_logger().setLevel("ERROR")
+# Suppress TensorFlow logging; must be set before TensorFlow is imported
 os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
 
+import numpy as np
+from backends import BACKENDS, create_backend
+from batching import BatchScheduler
+from metrics import MetricsExporter, StageMetrics, StageTimer
+from preprocessing import BatchBuffer, load_image, normalize, open_image, to_uint8
+from prediction_cache import (
+    CACHE_MODES,
+    PredictionCache,
+    content_key,
+    model_fingerprint,
+    perceptual_key,
+)
+from worker_pool import WorkerPool, plan_cpus
+
 # Define categories
 CATEGORIES = ["non_food", "food", "junk_food"]
 
+# Same limit the upload route enforces
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
 
-def load_model():
-    try:
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        model_path = os.path.join(current_dir, "../model/model_latest.h5")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
 
-        if not os.path.exists(model_path):
-            raise FileNotFoundError(f"Model file not found at {model_path}")
 
-        model = tf.keras.models.load_model(model_path, compile=False)
-        return model
+def load_model(
+    backend="keras", model_path=None, num_threads=None, warmup=(), inter_op_threads=None
+):
+    """Load the model into the chosen backend (see backends.py)"""
+    try:
+        return create_backend(
+            backend,
+            model_path,
+            num_threads=num_threads,
+            warmup=warmup,
+            inter_op_threads=inter_op_threads,
+        )
     except Exception as e:
         error_msg = f"Failed to load model: {str(e)}"
         print(json.dumps({"error": error_msg}))
         sys.exit(1)
 
 
-def preprocess_image(image_path):
+def read_image(source, size=(224, 224), draft=True, timer=None):
+    """
+    Load an image as a float32 (1, height, width, 3) batch, raising on failure.
+    source is a file path or raw image bytes (see preprocessing.py).
+    """
+    image = open_image(source, size if draft else None)
+    if timer is not None:
+        timer.mark("decode")
+    image = normalize(to_uint8(image, size)[np.newaxis])
+    if timer is not None:
+        timer.mark("preprocess")
+    return image
+
+
+def preprocess_image(image_path, size=(224, 224), draft=True, timer=None):
     try:
-        if not os.path.exists(image_path):
-            raise FileNotFoundError(f"Image file not found at {image_path}")
-
-        image = Image.open(image_path)
-        image = image.convert("RGB")
-        image = image.resize((224, 224))
-        image = np.array(image)
-        image = image / 255.0
-        image = np.expand_dims(image, axis=0)
-        return image
+        return read_image(image_path, size, draft, timer)
     except Exception as e:
         error_msg = f"Failed to process image: {str(e)}"
         print(json.dumps({"error": error_msg}))
         sys.exit(1)
 
 
+def decode_base64_image(data):
+    """Decode the image_b64 request field into raw image bytes"""
+    try:
+        image_bytes = base64.b64decode(data, validate=True)
+    except (binascii.Error, TypeError) as e:
+        raise ValueError(f"Invalid image_b64: {str(e)}")
+    if len(image_bytes) > MAX_IMAGE_BYTES:
+        raise ValueError(f"Image larger than {MAX_IMAGE_BYTES} bytes")
+    return image_bytes
+
+
+def read_frame(stream):
+    """
+    Read one length-prefixed frame (4-byte big-endian length, then that many
+    bytes) from a binary stream. Returns None at end of stream.
+    """
+    header = stream.read(4)
+    if not header:
+        return None
+    if len(header) < 4:
+        raise EOFError("Truncated frame header")
+
+    length = int.from_bytes(header, "big")
+    if length > MAX_IMAGE_BYTES:
+        # Consume the oversized frame so the next one is still aligned
+        while length > 0:
+            skipped = len(stream.read(min(length, 1024 * 1024)))
+            if not skipped:
+                raise EOFError("Truncated frame")
+            length -= skipped
+        raise ValueError(f"Image larger than {MAX_IMAGE_BYTES} bytes")
+
+    data = stream.read(length)
+    if len(data) < length:
+        raise EOFError("Truncated frame")
+    return data
+
+
+def format_prediction(predictions):
+    """Build the {category, confidence, all_probabilities} response"""
+    predicted_class = np.argmax(predictions)
+    confidence = float(predictions[predicted_class])
+
+    return {
+        "category": CATEGORIES[predicted_class],
+        "confidence": confidence,
+        "all_probabilities": {
+            cat: float(prob) for cat, prob in zip(CATEGORIES, predictions)
+        },
+    }
+
+
+def stdout_writer():
+    """Thread-safe writer of one response line to stdout"""
+    write_lock = threading.Lock()
+
+    def write(response):
+        with write_lock:
+            sys.stdout.write(response + "\n")
+            sys.stdout.flush()
+
+    return write
+
+
+class RequestServer:
+    """
+    Answers JSON-line requests over stdin, length-prefixed frames on stdin or a
+    Unix domain socket. Requests are handled concurrently on a thread pool, so
+    responses are written as they complete; clients match them up by id.
+    Subclasses implement respond().
+
+    Every classification is timed per stage into cumulative histograms, which
+    the metrics op returns and metrics_path receives in Prometheus text format.
+    """
+
+    def __init__(
+        self,
+        max_concurrency,
+        include_timings=False,
+        metrics_path=None,
+        metrics_interval=10.0,
+    ):
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        self.include_timings = include_timings
+        self.metrics = StageMetrics()
+        self.exporter = None
+        if metrics_path:
+            self.exporter = MetricsExporter(
+                self.metrics, metrics_path, metrics_interval
+            )
+
+    def respond(self, request, image_bytes=None, timer=None):
+        """
+        Build the response dict for one request; raise to report an error.
+        Classifications mark their stages on timer.
+        """
+        raise NotImplementedError
+
+    def handle_request(self, request, image_bytes=None):
+        """
+        Answer one decoded request; errors are reported per request.
+        image_bytes carries the image for transports that send it out of band.
+        """
+        timer = StageTimer()
+        request_id = request.get("id") if isinstance(request, dict) else None
+        try:
+            if not isinstance(request, dict):
+                raise ValueError("Request must be a JSON object")
+            if request.get("op") == "metrics":
+                response = {"metrics": self.metrics.summary()}
+            else:
+                response = self.respond(request, image_bytes, timer)
+        except Exception as e:
+            response = {"error": f"Request failed: {str(e)}"}
+
+        # Only classifications mark stages; ops and failures are not recorded
+        timed = bool(timer.timings) and "error" not in response
+        if timed and (self.include_timings or request.get("timings")):
+            # A pool worker's own breakdown is more useful than the dispatch time
+            response.setdefault("timings", timer.as_ms())
+        if request_id is not None:
+            response["id"] = request_id
+
+        line = json.dumps(response)
+        if timed:
+            timer.mark("serialize")
+            self.metrics.observe_timer(timer)
+        return line
+
+    def handle_line(self, line):
+        """Answer one JSON request line"""
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            return json.dumps({"error": f"Request failed: {str(e)}"})
+        return self.handle_request(request)
+
+    def dispatch(self, line, write):
+        """Handle a request on the worker pool and pass its response to write"""
+        return self._submit(write, self.handle_line, line)
+
+    def _submit(self, write, handler, *args):
+        # Writing inside the task means the future completes only once the
+        # response is out, so callers can wait on it before closing
+        return self.executor.submit(lambda: write(handler(*args)))
+
+    def serve_stdio(self):
+        """
+        Read requests from stdin and write responses to stdout, one per line.
+        Responses are written as they complete, so match them up by id.
+        """
+        write = stdout_writer()
+        print("Ready, reading requests from stdin", file=sys.stderr)
+        for line in sys.stdin:
+            if line.strip():
+                self.dispatch(line, write)
+        self.shutdown()
+
+    def serve_framed(self):
+        """
+        Read raw images from stdin as length-prefixed frames and write one JSON
+        response line per frame. Frames are numbered from 0 and each response
+        carries its frame number as id.
+        """
+        write = stdout_writer()
+        print("Ready, reading image frames from stdin", file=sys.stderr)
+        frame_id = 0
+        while True:
+            try:
+                data = read_frame(sys.stdin.buffer)
+            except ValueError as e:
+                error = {"error": f"Request failed: {str(e)}", "id": frame_id}
+                write(json.dumps(error))
+                frame_id += 1
+                continue
+            except EOFError as e:
+                print(f"Stopped reading frames: {str(e)}", file=sys.stderr)
+                break
+            if data is None:
+                break
+            self._submit(write, self.handle_request, {"id": frame_id}, data)
+            frame_id += 1
+        self.shutdown()
+
+    def serve_socket(self, socket_path):
+        """Serve the same JSON-line protocol on a Unix domain socket"""
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                write_lock = threading.Lock()
+
+                def write(response):
+                    with write_lock:
+                        try:
+                            self.wfile.write((response + "\n").encode("utf-8"))
+                            self.wfile.flush()
+                        except OSError:
+                            pass  # Client went away before its response
+
+                pending = [
+                    server.dispatch(line.decode("utf-8"), write)
+                    for line in self.rfile
+                    if line.strip()
+                ]
+                # Keep the connection open until every response is written
+                for future in pending:
+                    future.result()
+
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+        with socketserver.ThreadingUnixStreamServer(socket_path, Handler) as sock:
+            sock.daemon_threads = True
+            print(f"Ready, listening on {socket_path}", file=sys.stderr)
+            try:
+                sock.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                os.unlink(socket_path)
+                self.shutdown()
+
+    def shutdown(self):
+        """Drain outstanding requests and write the final metrics"""
+        self.executor.shutdown(wait=True)
+        if self.exporter is not None:
+            self.exporter.stop()
+        print(json.dumps({"metrics": self.metrics.summary()}), file=sys.stderr)
+
+
+class InferenceServer(RequestServer):
+    """Keeps the model resident and answers JSON-line classification requests"""
+
+    def __init__(
+        self,
+        model,
+        max_batch_size=16,
+        max_wait_ms=5.0,
+        cache=None,
+        draft=True,
+        **server_options,
+    ):
+        # Requests are decoded on the request threads so the scheduler sees
+        # them concurrently and can fill its batches
+        super().__init__(max_concurrency=max_batch_size * 2, **server_options)
+        self.input_size = model.input_size
+        self.cache = cache
+        self.draft = draft
+        # Requests queue as uint8 and are normalized straight into one buffer
+        self.scheduler = BatchScheduler(
+            model.predict,
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms,
+            collate=BatchBuffer(max_batch_size, self.input_size).fill,
+            on_batch=lambda size, seconds: self.metrics.observe(
+                "batch_forward", seconds
+            ),
+        )
+
+    def classify(self, source, timer):
+        """
+        Classify one image, marking decode, preprocess, inference (queueing
+        plus the batched forward pass) and postprocess on timer
+        """
+        if self.cache is not None:
+            return self.classify_cached(source, timer)
+
+        image = self._open(source)
+        timer.mark("decode")
+        image = to_uint8(image, self.input_size)
+        timer.mark("preprocess")
+        predictions = self.scheduler.predict(image)
+        timer.mark("inference")
+        result = format_prediction(predictions)
+        timer.mark("postprocess")
+        return result
+
+    def _open(self, source):
+        return open_image(source, self.input_size if self.draft else None)
+
+    def classify_cached(self, source, timer):
+        """Classify through the prediction cache, reporting hits and misses"""
+        if not isinstance(source, (bytes, bytearray, memoryview)):
+            if not os.path.exists(source):
+                raise FileNotFoundError(f"Image file not found at {source}")
+            # Read once: the same bytes are hashed and decoded
+            with open(source, "rb") as f:
+                source = f.read()
+
+        perceptual = self.cache.mode == "perceptual"
+        keys = [content_key(source)]
+        result = self.cache.get(*keys, count_miss=not perceptual)
+        timer.mark("cache")
+        image = None
+        if result is None and perceptual:
+            # A miss on the exact bytes may still be a re-encode of a known photo
+            image = self._open(source)
+            timer.mark("decode")
+            keys.append(perceptual_key(image))
+            result = self.cache.get(keys[1])
+            timer.mark("cache")
+
+        hit = result is not None
+        if not hit:
+            if image is None:
+                image = self._open(source)
+                timer.mark("decode")
+            image = to_uint8(image, self.input_size)
+            timer.mark("preprocess")
+            predictions = self.scheduler.predict(image)
+            timer.mark("inference")
+            result = format_prediction(predictions)
+            self.cache.put(keys, result)
+        elif len(keys) > 1:
+            # Perceptual hit: let the next identical upload match on its bytes
+            self.cache.put(keys[:1], result)
+
+        stats = self.cache.stats()
+        result["cache"] = {
+            "hit": hit,
+            "hits": stats["hits"],
+            "misses": stats["misses"],
+        }
+        timer.mark("postprocess")
+        return result
+
+    def respond(self, request, image_bytes=None, timer=None):
+        if request.get("op") == "stats":
+            response = {"batching": self.scheduler.stats()}
+            if self.cache is not None:
+                response["cache"] = self.cache.stats()
+            response["latency"] = self.metrics.summary()
+            return response
+
+        timer = timer or StageTimer()
+        if image_bytes is not None:
+            return self.classify(image_bytes, timer)
+        if "image_b64" in request:
+            image_bytes = decode_base64_image(request["image_b64"])
+            timer.mark("decode")
+            return self.classify(image_bytes, timer)
+        if "image_path" in request:
+            return self.classify(request["image_path"], timer)
+        raise ValueError("Image path not provided")
+
+    def shutdown(self):
+        """Drain outstanding requests and report the batch sizes achieved"""
+        super().shutdown()
+        self.scheduler.close()
+        print(json.dumps({"batching": self.scheduler.stats()}), file=sys.stderr)
+        if self.cache is not None:
+            self.cache.save()
+            print(json.dumps({"cache": self.cache.stats()}), file=sys.stderr)
+
+
+class PoolServer(RequestServer):
+    """
+    Spreads requests over several model worker processes (see worker_pool.py),
+    which scales past what one process can do with the GIL in pre- and
+    post-processing.
+    """
+
+    def __init__(self, pool, max_concurrency, **server_options):
+        super().__init__(max_concurrency, **server_options)
+        self.pool = pool
+
+    def respond(self, request, image_bytes=None, timer=None):
+        if request.get("op") == "stats":
+            return {"pool": self.pool.stats(), "latency": self.metrics.summary()}
+
+        forwarded = {key: value for key, value in request.items() if key != "id"}
+        if image_bytes is not None:
+            forwarded["image_b64"] = base64.b64encode(image_bytes).decode("ascii")
+        response = self.pool.submit(forwarded).result()
+        if timer is not None and "error" not in response:
+            timer.mark("worker")
+        return response
+
+    def shutdown(self):
+        super().shutdown()
+        print(json.dumps({"pool": self.pool.stats()}), file=sys.stderr)
+        self.pool.close()
+
+
+def iter_image_paths(source):
+    """
+    Lazily yield image paths from a directory tree, a glob pattern, a
+    newline-delimited list file, or - for a list on stdin
+    """
+    if source == "-":
+        lines = (line.strip() for line in sys.stdin)
+        yield from (line for line in lines if line)
+    elif os.path.isdir(source):
+        pending = [source]
+        while pending:
+            with os.scandir(pending.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        pending.append(entry.path)
+                    elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                        yield entry.path
+    elif os.path.isfile(source) and not source.lower().endswith(IMAGE_EXTENSIONS):
+        with open(source) as f:
+            lines = (line.strip() for line in f)
+            yield from (line for line in lines if line)
+    else:
+        for path in glob.iglob(source, recursive=True):
+            if path.lower().endswith(IMAGE_EXTENSIONS):
+                yield path
+
+
+def load_processed(output_path):
+    """Paths already recorded in a previous run's output, for --resume"""
+    processed = set()
+    if not output_path or not os.path.exists(output_path):
+        return processed
+
+    with open(output_path) as f:
+        for line in f:
+            try:
+                processed.add(json.loads(line)["image"])
+            except (ValueError, KeyError, TypeError):
+                continue  # Line cut short when the previous run was interrupted
+    return processed
+
+
+def classify_batch(model, paths, write, batch_size=32, decode_workers=8, draft=True):
+    """
+    Classify a stream of image paths, writing one JSON line per image in input
+    order. Decoding runs ahead on a thread pool while the previous batch is in
+    the model, and at most two batches of uint8 images are held in memory.
+    """
+    counts = {"processed": 0, "failed": 0}
+    buffer = BatchBuffer(batch_size, model.input_size)
+
+    def flush(batch):
+        images = [image for _, image in batch if not isinstance(image, Exception)]
+        if images:
+            predictions = iter(model.predict(buffer.fill(images)))
+        for path, image in batch:
+            if isinstance(image, Exception):
+                result = {"error": f"Failed to process image: {str(image)}"}
+                counts["failed"] += 1
+            else:
+                result = format_prediction(next(predictions))
+                counts["processed"] += 1
+            result["image"] = path
+            write(json.dumps(result))
+
+    def decode(path):
+        try:
+            return load_image(path, model.input_size, draft)
+        except Exception as e:
+            return e
+
+    in_flight = deque()
+    batch = []
+
+    def take_decoded():
+        path, future = in_flight.popleft()
+        batch.append((path, future.result()))
+        if len(batch) == batch_size:
+            flush(batch)
+            batch.clear()
+
+    with ThreadPoolExecutor(max_workers=decode_workers) as executor:
+        for path in paths:
+            in_flight.append((path, executor.submit(decode, path)))
+            if len(in_flight) >= batch_size * 2:
+                take_decoded()
+        while in_flight:
+            take_decoded()
+        if batch:
+            flush(batch)
+
+    return counts
+
+
+def run_batch(args):
+    """Batch mode: classify every image in args.batch and stream the results"""
+    processed = load_processed(args.output) if args.resume else set()
+    paths = (path for path in iter_image_paths(args.batch) if path not in processed)
+    if processed:
+        print(f"Resuming: skipping {len(processed)} processed images", file=sys.stderr)
+
+    model = load_model(args.backend, args.model, args.num_threads)
+
+    output = open(args.output, "a") if args.output else sys.stdout
+    try:
+
+        def write(line):
+            output.write(line + "\n")
+            output.flush()
+
+        counts = classify_batch(
+            model,
+            paths,
+            write,
+            batch_size=args.batch_size,
+            decode_workers=args.decode_workers,
+            draft=not args.no_draft,
+        )
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    print(json.dumps(counts), file=sys.stderr)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Classify food images")
+    parser.add_argument(
+        "image_path",
+        nargs="?",
+        help="Image to classify once, or - to read the image bytes from stdin",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Keep the model loaded and read JSON-line requests from stdin",
+    )
+    parser.add_argument(
+        "--framed",
+        action="store_true",
+        help="Keep the model loaded and read length-prefixed raw images from stdin",
+    )
+    parser.add_argument(
+        "--socket",
+        metavar="PATH",
+        help="Keep the model loaded and serve requests on a Unix domain socket",
+    )
+    parser.add_argument(
+        "--batch",
+        metavar="SOURCE",
+        help="Classify every image in a directory, glob, list file or - (stdin list)",
+    )
+    parser.add_argument(
+        "--output",
+        metavar="PATH",
+        help="Append batch results to this JSON-lines file instead of stdout",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip images already recorded in --output by an interrupted run",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=32,
+        help="Images per forward pass in batch mode",
+    )
+    parser.add_argument(
+        "--decode-workers",
+        type=int,
+        default=8,
+        help="Threads decoding images ahead of the model in batch mode",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=sorted(BACKENDS),
+        default="keras",
+        help="Run the Keras .h5 model or the TFLite model shipped to phones",
+    )
+    parser.add_argument(
+        "--model",
+        metavar="PATH",
+        help="Model file to load instead of the backend's default",
+    )
+    parser.add_argument(
+        "--num-threads",
+        type=int,
+        help="CPU threads the backend may use for one forward pass",
+    )
+    parser.add_argument(
+        "--inter-op-threads",
+        type=int,
+        help="Independent ops the Keras backend may run in parallel",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Serve with this many model processes behind a least-loaded dispatcher",
+    )
+    parser.add_argument(
+        "--pin-cpus",
+        action="store_true",
+        help="Give each worker its own block of CPUs (and that many threads)",
+    )
+    parser.add_argument(
+        "--cpus",
+        help="Comma-separated CPU ids this process is restricted to",
+    )
+    parser.add_argument(
+        "--warmup",
+        action="store_true",
+        help="Run a dummy inference at load so the first request is not slow",
+    )
+    parser.add_argument(
+        "--no-draft",
+        action="store_true",
+        help="Fully decode JPEGs before resizing instead of using DCT scaling",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=0,
+        help="Cache up to this many predictions by image content (0 disables)",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=3600.0,
+        help="Seconds a cached prediction stays valid (0 never expires)",
+    )
+    parser.add_argument(
+        "--cache-mode",
+        choices=CACHE_MODES,
+        default="exact",
+        help="Match identical bytes only, or also near-identical re-encodes",
+    )
+    parser.add_argument(
+        "--cache-file",
+        metavar="PATH",
+        help="Load the cache from and save it to this file across restarts",
+    )
+    parser.add_argument(
+        "--max-batch-size",
+        type=int,
+        default=16,
+        help="Largest batch the serving mode runs in one forward pass",
+    )
+    parser.add_argument(
+        "--max-wait-ms",
+        type=float,
+        default=5.0,
+        help="How long a request may wait for others to join its batch",
+    )
+    parser.add_argument(
+        "--timings",
+        action="store_true",
+        help="Add per-stage latencies in milliseconds to every response",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        metavar="PATH",
+        help="Periodically write stage latency histograms here (Prometheus text)",
+    )
+    parser.add_argument(
+        "--metrics-interval",
+        type=float,
+        default=10.0,
+        help="Seconds between writes of --metrics-file",
+    )
+    return parser.parse_args()
+
+
+def server_options(args, metrics_path=None):
+    """Keyword arguments shared by both server classes"""
+    return {
+        "include_timings": args.timings,
+        "metrics_path": metrics_path or args.metrics_file,
+        "metrics_interval": args.metrics_interval,
+    }
+
+
+def worker_command(args, index, cpus):
+    """Command line for one pool worker, mirroring this process's options"""
+    command = [sys.executable, os.path.abspath(__file__), "--serve"]
+    command += ["--backend", args.backend]
+    command += ["--max-batch-size", str(args.max_batch_size)]
+    command += ["--max-wait-ms", str(args.max_wait_ms)]
+    if args.model:
+        command += ["--model", args.model]
+
+    num_threads = args.num_threads or (len(cpus) if cpus else None)
+    if num_threads:
+        command += ["--num-threads", str(num_threads)]
+    if args.inter_op_threads:
+        command += ["--inter-op-threads", str(args.inter_op_threads)]
+    if cpus:
+        command += ["--cpus", ",".join(str(cpu) for cpu in cpus)]
+
+    if args.warmup:
+        command.append("--warmup")
+    if args.no_draft:
+        command.append("--no-draft")
+    if args.cache_size > 0:
+        command += ["--cache-size", str(args.cache_size)]
+        command += ["--cache-ttl", str(args.cache_ttl)]
+        command += ["--cache-mode", args.cache_mode]
+        if args.cache_file:
+            # Each worker owns its cache, so each needs its own file
+            command += ["--cache-file", f"{args.cache_file}.{index}"]
+    if args.timings:
+        command.append("--timings")
+    if args.metrics_file:
+        # metrics.prom -> metrics.0.prom, beside the supervisor's own file
+        root, ext = os.path.splitext(args.metrics_file)
+        command += ["--metrics-file", f"{root}.{index}{ext}"]
+        command += ["--metrics-interval", str(args.metrics_interval)]
+    return command
+
+
+def serve_pool(args):
+    cpu_plan = plan_cpus(args.workers, args.pin_cpus)
+    pool = WorkerPool(
+        [worker_command(args, index, cpus) for index, cpus in enumerate(cpu_plan)]
+    )
+    return PoolServer(
+        pool,
+        max_concurrency=args.workers * args.max_batch_size * 2,
+        **server_options(args),
+    )
+
+
+def serve_single(args):
+    if args.cpus:
+        # Pin before the runtime is imported so its thread pools start here
+        os.sched_setaffinity(0, {int(cpu) for cpu in args.cpus.split(",")})
+
+    # Warm both the single-request and the full-batch shapes
+    warmup = (1, args.max_batch_size) if args.warmup else ()
+    model = load_model(
+        args.backend, args.model, args.num_threads, warmup, args.inter_op_threads
+    )
+
+    cache = None
+    if args.cache_size > 0:
+        cache = PredictionCache(
+            max_entries=args.cache_size,
+            ttl_seconds=args.cache_ttl,
+            mode=args.cache_mode,
+            persist_path=args.cache_file,
+            model_id=f"{args.backend}:{model_fingerprint(model.model_path)}",
+        )
+
+    return InferenceServer(
+        model,
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+        cache=cache,
+        draft=not args.no_draft,
+        **server_options(args),
+    )
+
+
+def serve(args):
+    if args.workers > 1:
+        server = serve_pool(args)
+    else:
+        server = serve_single(args)
+
+    if args.socket:
+        server.serve_socket(args.socket)
+    elif args.framed:
+        server.serve_framed()
+    else:
+        server.serve_stdio()
+
+
 def main():
     try:
-        if len(sys.argv) != 2:
+        args = parse_args()
+        if args.serve or args.framed or args.socket:
+            serve(args)
+            return
+        if args.batch:
+            if args.resume and not args.output:
+                raise ValueError("--resume needs --output")
+            run_batch(args)
+            return
+
+        if args.image_path is None:
             raise ValueError("Image path not provided")
 
-        image_path = sys.argv[1]
-        model = load_model()
-        processed_image = preprocess_image(image_path)
-
-        # Disable progress bar for prediction
-        predictions = model.predict(processed_image, verbose=0)[0]
-        predicted_class = np.argmax(predictions)
-        confidence = float(predictions[predicted_class])
-
-        result = {
-            "category": CATEGORIES[predicted_class],
-            "confidence": confidence,
-            "all_probabilities": {
-                cat: float(prob) for cat, prob in zip(CATEGORIES, predictions)
-            },
-        }
+        image_path = args.image_path
+        if image_path == "-":
+            image_path = sys.stdin.buffer.read()
+        timer = StageTimer()
+        model = load_model(args.backend, args.model, args.num_threads)
+        timer.mark("load")
+        processed_image = preprocess_image(
+            image_path, model.input_size, draft=not args.no_draft, timer=timer
+        )
+
+        predictions = model.predict(processed_image)[0]
+        timer.mark("inference")
+        result = format_prediction(predictions)
+        timer.mark("postprocess")
+        if args.timings:
+            result["timings"] = timer.as_ms()
 
         print(json.dumps(result))
 
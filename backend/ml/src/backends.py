@@ -0,0 +1,169 @@
+# backends.py
+import os
+
+import numpy as np
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../model")
+
+DEFAULT_MODELS = {
+    "keras": os.path.join(MODEL_DIR, "model_latest.h5"),
+    "tflite": os.path.join(MODEL_DIR, "model_latest.tflite"),
+}
+
+
+def import_runtime(name: str):
+    """
+    Import only what the named backend needs. TensorFlow is the bulk of cold
+    start, so it is never imported for the TFLite backend when the standalone
+    runtime is installed.
+    """
+    # Must be set before TensorFlow is imported to have any effect
+    os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "3")
+
+    if name == "keras":
+        import tensorflow as tf
+
+        tf.get_logger().setLevel("ERROR")
+        return tf
+
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        from tensorflow.lite.python.interpreter import Interpreter
+    return Interpreter
+
+
+class KerasBackend:
+    """Runs the full Keras model through TensorFlow"""
+
+    def __init__(
+        self, model_path: str, num_threads: int = None, inter_op_threads: int = None
+    ):
+        tf = import_runtime("keras")
+        self.model_path = model_path
+        if num_threads:
+            tf.config.threading.set_intra_op_parallelism_threads(num_threads)
+        if inter_op_threads:
+            tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+        self.model = tf.keras.models.load_model(model_path, compile=False)
+        self.input_size = tuple(self.model.input_shape[1:3])
+
+    def warmup(self, batch_sizes=(1,)):
+        """Run dummy batches so the first real request skips graph tracing"""
+        for batch_size in batch_sizes:
+            self.predict(np.zeros((batch_size, *self.input_size, 3), np.float32))
+
+    def predict(self, images: np.ndarray) -> np.ndarray:
+        # predict_on_batch skips the per-call setup that makes predict() slow
+        return np.asarray(self.model.predict_on_batch(images))
+
+
+class TFLiteBackend:
+    """
+    Runs the .tflite model shipped to the mobile clients.
+
+    Batches are padded up to a power of two and each padded size keeps its own
+    interpreter, so input and output tensors are allocated once and reused
+    instead of being resized whenever the batch size changes.
+    """
+
+    def __init__(
+        self, model_path: str, num_threads: int = None, inter_op_threads: int = None
+    ):
+        # The interpreter runs ops one after another, so inter_op_threads is
+        # accepted for a uniform interface but has no effect
+        # Prefers the standalone TFLite runtime so Keras is never imported
+        self.Interpreter = import_runtime("tflite")
+        self.model_path = model_path
+        with open(model_path, "rb") as f:
+            self.model_content = f.read()
+        self.num_threads = num_threads
+        self.interpreters = {}
+
+        interpreter = self._create_interpreter()
+        input_details = interpreter.get_input_details()[0]
+        self.input_size = tuple(int(dim) for dim in input_details["shape"][1:3])
+        self.interpreters[int(input_details["shape"][0])] = interpreter
+
+    def _create_interpreter(self, batch_size: int = None):
+        interpreter = self.Interpreter(
+            model_content=self.model_content, num_threads=self.num_threads
+        )
+        if batch_size is not None:
+            input_details = interpreter.get_input_details()[0]
+            shape = list(input_details["shape"])
+            shape[0] = batch_size
+            interpreter.resize_tensor_input(input_details["index"], shape)
+        interpreter.allocate_tensors()
+        return interpreter
+
+    def _interpreter_for(self, batch_size: int):
+        padded_size = 1 << (batch_size - 1).bit_length()
+        if padded_size not in self.interpreters:
+            self.interpreters[padded_size] = self._create_interpreter(padded_size)
+        return padded_size, self.interpreters[padded_size]
+
+    def warmup(self, batch_sizes=(1,)):
+        """Allocate and run each batch size's interpreter once ahead of traffic"""
+        for batch_size in batch_sizes:
+            self.predict(np.zeros((batch_size, *self.input_size, 3), np.float32))
+
+    def predict(self, images: np.ndarray) -> np.ndarray:
+        count = len(images)
+        _, interpreter = self._interpreter_for(count)
+        input_details = interpreter.get_input_details()[0]
+        output_details = interpreter.get_output_details()[0]
+
+        # Write straight into the interpreter's input buffer
+        input_tensor = interpreter.tensor(input_details["index"])()
+        scale, zero_point = input_details["quantization"]
+        if scale:
+            limits = np.iinfo(input_tensor.dtype)
+            images = np.clip(
+                np.round(images / scale + zero_point), limits.min, limits.max
+            )
+        input_tensor[:count] = images
+        input_tensor[count:] = 0
+        del input_tensor  # The interpreter must not be invoked with views alive
+
+        interpreter.invoke()
+
+        predictions = interpreter.get_tensor(output_details["index"])[:count]
+        scale, zero_point = output_details["quantization"]
+        if scale:
+            predictions = (predictions.astype(np.float32) - zero_point) * scale
+        return predictions
+
+
+BACKENDS = {
+    "keras": KerasBackend,
+    "tflite": TFLiteBackend,
+}
+
+
+def create_backend(
+    name: str,
+    model_path: str = None,
+    num_threads: int = None,
+    warmup=(),
+    inter_op_threads: int = None,
+):
+    """
+    Load the named backend from model_path, or from the default model file,
+    optionally running one dummy inference per batch size in warmup.
+    num_threads bounds the threads used inside one op (intra-op) and
+    inter_op_threads the ops run in parallel (Keras only).
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend: {name}")
+
+    model_path = model_path or DEFAULT_MODELS[name]
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Model file not found at {model_path}")
+
+    backend = BACKENDS[name](
+        model_path, num_threads=num_threads, inter_op_threads=inter_op_threads
+    )
+    if warmup:
+        backend.warmup(warmup)
+    return backend
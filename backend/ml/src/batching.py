@@ -0,0 +1,138 @@
+# batching.py
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+
+import numpy as np
+
+
+def _stack(images):
+    return np.stack(images).astype(np.float32)
+
+
+class BatchScheduler:
+    """
+    Collects concurrent single-image requests into one forward pass.
+
+    A batch is run as soon as max_batch_size requests are waiting, or when the
+    oldest waiting request has been queued for max_wait_ms, whichever is first.
+    """
+
+    def __init__(
+        self,
+        predict_fn,
+        max_batch_size: int = 16,
+        max_wait_ms: float = 5.0,
+        collate=None,
+        on_batch=None,
+    ):
+        """
+        Args:
+            predict_fn: Callable taking an (N, H, W, 3) array and returning N rows
+            max_batch_size: Largest batch handed to predict_fn
+            max_wait_ms: Longest time a request waits for others to join its batch
+            collate: Builds predict_fn's input from the list of queued images;
+                defaults to stacking them as float32
+            on_batch: Optional callback(batch_size, seconds) after each forward pass
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+
+        self.predict_fn = predict_fn
+        self.collate = collate or _stack
+        self.on_batch = on_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._pending = deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._batch_sizes = Counter()
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, image: np.ndarray) -> Future:
+        """Queue an (H, W, 3) image; the future resolves to its prediction row"""
+        future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Scheduler is closed")
+            self._pending.append((image, future, time.monotonic()))
+            self._condition.notify()
+        return future
+
+    def predict(self, image: np.ndarray) -> np.ndarray:
+        """Submit an image and block until its prediction is ready"""
+        return self.submit(image).result()
+
+    def _next_batch(self):
+        with self._condition:
+            while not self._pending and not self._closed:
+                self._condition.wait()
+
+            if self._pending:
+                deadline = self._pending[0][2] + self.max_wait
+                while len(self._pending) < self.max_batch_size and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+
+            size = min(len(self._pending), self.max_batch_size)
+            return [self._pending.popleft() for _ in range(size)]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+
+            futures = [future for _, future, _ in batch]
+            start = time.perf_counter()
+            try:
+                images = self.collate([image for image, _, _ in batch])
+                predictions = self.predict_fn(images)
+                if len(predictions) != len(batch):
+                    raise ValueError(
+                        f"predict_fn returned {len(predictions)} rows "
+                        f"for {len(batch)} images"
+                    )
+
+                with self._condition:
+                    self._batch_sizes[len(batch)] += 1
+                if self.on_batch is not None:
+                    self.on_batch(len(batch), time.perf_counter() - start)
+
+                for future, prediction in zip(futures, predictions):
+                    future.set_result(prediction)
+            except Exception as e:
+                # Whatever failed, no caller is left waiting and the thread
+                # keeps serving later batches
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def stats(self) -> dict:
+        """Batch sizes actually achieved so far, for tuning the limits"""
+        with self._condition:
+            sizes = dict(sorted(self._batch_sizes.items()))
+
+        batches = sum(sizes.values())
+        requests = sum(size * count for size, count in sizes.items())
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "batches": batches,
+            "requests": requests,
+            "mean_batch_size": requests / batches if batches else 0.0,
+            "batch_sizes": {str(size): count for size, count in sizes.items()},
+        }
+
+    def close(self):
+        """Finish the queued requests and stop the scheduler thread"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
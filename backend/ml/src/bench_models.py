@@ -0,0 +1,205 @@
+# bench_models.py
+"""
+Accuracy against latency across MobileNetV2 widths (alpha) and input sizes.
+
+For every (alpha, size) a head is trained on frozen backbone features, the
+same ones train.py --mode head stores (and reuses) under ../data/features.
+The assembled model is then measured: evaluation accuracy, single-image
+latency and batched throughput through both serving backends (Keras and
+dynamic-range TFLite), and file sizes. The results end in a table with the
+Pareto-optimal configurations (no other is both more accurate and faster)
+marked, and the cheapest one reaching --target-accuracy.
+
+Usage: python bench_models.py [--alphas 0.35 0.5 0.75 1.0]
+           [--sizes 128 160 192 224] [--target-accuracy 0.9]
+           [--output ../bench/models]
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+import train
+from backends import create_backend
+from convert_to_tflite import convert_model, measure_latency
+from dataset import FoodDataset
+from embeddings import extract_features, train_head
+from model import assemble_model, create_feature_extractor, create_head
+
+# Widths with ImageNet weights for every size below
+ALPHAS = [0.35, 0.5, 0.75, 1.0]
+SIZES = [128, 160, 192, 224]
+
+
+def measure_throughput(backend, images, runs=10):
+    """Images per second over whole batches"""
+    backend.predict(images)
+    start = time.perf_counter()
+    for _ in range(runs):
+        backend.predict(images)
+    return runs * len(images) / (time.perf_counter() - start)
+
+
+def pareto_front(results, latency_key="tflite_p50_ms"):
+    """Indices of results no other result beats on both accuracy and latency"""
+    front = []
+    for i, result in enumerate(results):
+        dominated = any(
+            other["accuracy"] >= result["accuracy"]
+            and other[latency_key] <= result[latency_key]
+            and (
+                other["accuracy"] > result["accuracy"]
+                or other[latency_key] < result[latency_key]
+            )
+            for other in results
+        )
+        if not dominated:
+            front.append(i)
+    return front
+
+
+def benchmark(alpha, size, args):
+    """Train a head for one backbone configuration and measure the model"""
+    import tensorflow as tf
+
+    tf.keras.backend.clear_session()
+    img_size = (size, size)
+    # Images straight from the dataset; the shards only hold train.IMG_SIZE
+    dataset = FoodDataset(train.DATA_DIR, img_size, train.BATCH_SIZE)
+
+    feature_extractor = create_feature_extractor((*img_size, 3), alpha)
+    name = feature_extractor.layers[0].name
+    feature_dir = os.path.join(train.FEATURE_DIR, name)
+
+    splits = {}
+    for split in ("training", "validation", "evaluation"):
+        splits[split] = extract_features(
+            dataset,
+            feature_extractor,
+            feature_dir,
+            split,
+            train.cache_file(split, img_size),
+        )
+
+    head = create_head(feature_extractor.output_shape[-1], args.hidden_units)
+    train_head(
+        head,
+        *splits["training"],
+        *splits["validation"],
+        epochs=args.epochs,
+        batch_size=args.head_batch_size,
+    )
+
+    eval_features, eval_labels = splits["evaluation"]
+    predicted = np.argmax(head.predict(eval_features, verbose=0), axis=1)
+    accuracy = float(np.mean(predicted == eval_labels))
+
+    model = assemble_model(feature_extractor, head)
+    keras_path = os.path.join(args.output, f"{name}.h5")
+    tflite_path = os.path.join(args.output, f"{name}.tflite")
+    model.save(keras_path)
+    with open(tflite_path, "wb") as f:
+        f.write(convert_model(model, "dynamic"))
+
+    result = {
+        "alpha": alpha,
+        "size": size,
+        "accuracy": accuracy,
+        "params": model.count_params(),
+        "keras_mb": os.path.getsize(keras_path) / (1024 * 1024),
+        "tflite_mb": os.path.getsize(tflite_path) / (1024 * 1024),
+    }
+
+    image = np.random.rand(1, *img_size, 3).astype(np.float32)
+    batch = np.random.rand(args.batch_size, *img_size, 3).astype(np.float32)
+    for backend_name, path in (("keras", keras_path), ("tflite", tflite_path)):
+        backend = create_backend(backend_name, path, num_threads=args.threads)
+        p50, p95 = measure_latency(backend, image, args.runs)
+        result[f"{backend_name}_p50_ms"] = p50
+        result[f"{backend_name}_p95_ms"] = p95
+        result[f"{backend_name}_images_per_sec"] = measure_throughput(backend, batch)
+
+    return result
+
+
+def print_table(results, target_accuracy=None):
+    front = set(pareto_front(results))
+    columns = [
+        ("alpha", 2),
+        ("size", 0),
+        ("accuracy", 4),
+        ("keras_p50_ms", 2),
+        ("tflite_p50_ms", 2),
+        ("keras_images_per_sec", 1),
+        ("tflite_images_per_sec", 1),
+        ("tflite_mb", 2),
+    ]
+
+    print("\nModels by TFLite latency (* = Pareto-optimal):")
+    print("".join(f"{name:>{len(name) + 2}}" for name, _ in columns))
+    order = sorted(range(len(results)), key=lambda i: results[i]["tflite_p50_ms"])
+    for i in order:
+        row = "".join(
+            f"{results[i][name]:>{len(name) + 2}.{digits}f}" for name, digits in columns
+        )
+        print(row + (" *" if i in front else ""))
+
+    if target_accuracy is not None:
+        meeting = [i for i in order if results[i]["accuracy"] >= target_accuracy]
+        if meeting:
+            best = results[meeting[0]]
+            print(
+                f"\nCheapest model with accuracy >= {target_accuracy}: "
+                f"alpha {best['alpha']} at {best['size']}px "
+                f"({best['accuracy']:.4f}, {best['tflite_p50_ms']:.2f} ms)"
+            )
+        else:
+            print(f"\nNo model reaches accuracy {target_accuracy}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark backbone configurations")
+    parser.add_argument("--alphas", type=float, nargs="+", default=ALPHAS)
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--hidden-units", type=int, nargs="*", default=[128])
+    parser.add_argument("--epochs", type=int, default=50, help="Head epochs")
+    parser.add_argument("--head-batch-size", type=int, default=256)
+    parser.add_argument("--batch-size", type=int, default=32, help="Throughput batch")
+    parser.add_argument("--runs", type=int, default=50, help="Latency runs")
+    parser.add_argument("--threads", type=int, help="Inference threads")
+    parser.add_argument("--target-accuracy", type=float)
+    parser.add_argument("--output", default="../bench/models")
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    results_path = os.path.join(args.output, "results.json")
+
+    # Finished configurations are kept, so an interrupted run picks up again
+    results = []
+    if os.path.exists(results_path):
+        with open(results_path) as f:
+            results = json.load(f)
+    done = {(result["alpha"], result["size"]) for result in results}
+
+    for alpha in args.alphas:
+        for size in args.sizes:
+            if (alpha, size) in done:
+                continue
+            print(f"\n=== alpha {alpha}, {size}x{size} ===")
+            results.append(benchmark(alpha, size, args))
+            with open(results_path, "w") as f:
+                json.dump(results, f, indent=2)
+
+    selected = [
+        result
+        for result in results
+        if result["alpha"] in args.alphas and result["size"] in args.sizes
+    ]
+    print_table(selected, args.target_accuracy)
+    print(f"\nResults written to {results_path}")
+
+
+if __name__ == "__main__":
+    main()
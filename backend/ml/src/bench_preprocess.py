@@ -0,0 +1,95 @@
+# bench_preprocess.py
+"""
+Compare the original api.py preprocessing with the fast path in
+preprocessing.py (draft JPEG decoding, uint8 resize, fused float32 normalize
+into a preallocated batch buffer).
+
+Usage: python bench_preprocess.py [--images ../test_images] [--repeat 20]
+"""
+import argparse
+import os
+import statistics
+import time
+
+import numpy as np
+from PIL import Image
+
+from preprocessing import BatchBuffer, load_image
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def legacy_preprocess(image_path, size=(224, 224)):
+    """The original api.py path, including the float32 copy made by predict"""
+    image = Image.open(image_path)
+    image = image.convert("RGB")
+    image = image.resize((size[1], size[0]))
+    image = np.array(image)
+    image = image / 255.0
+    image = np.expand_dims(image, axis=0)
+    return image.astype(np.float32)
+
+
+def time_call(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark image preprocessing")
+    parser.add_argument("--images", default="../test_images")
+    parser.add_argument("--size", type=int, default=224)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    size = (args.size, args.size)
+    buffer = BatchBuffer(1, size)
+    paths = sorted(
+        os.path.join(args.images, name)
+        for name in os.listdir(args.images)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    if not paths:
+        raise ValueError(f"No images found in {args.images}")
+
+    print(f"Median time per image over {args.repeat} runs (ms):")
+    print("-" * 96)
+    print(
+        f"{'image':<44}{'pixels':>10}{'legacy':>10}{'fast':>10}"
+        f"{'speedup':>10}{'max diff':>12}"
+    )
+
+    totals = {"legacy": 0.0, "fast": 0.0}
+    for path in paths:
+        with Image.open(path) as image:
+            pixels = image.size[0] * image.size[1]
+
+        legacy = time_call(lambda: legacy_preprocess(path, size), args.repeat)
+        fast = time_call(lambda: buffer.fill([load_image(path, size)]), args.repeat)
+        totals["legacy"] += legacy
+        totals["fast"] += fast
+
+        # Draft decoding changes the resampling slightly; report by how much
+        difference = np.abs(
+            legacy_preprocess(path, size) - buffer.fill([load_image(path, size)])
+        ).max()
+
+        name = os.path.basename(path)[:42]
+        print(
+            f"{name:<44}{pixels / 1e6:>9.1f}M{legacy * 1000:>10.2f}"
+            f"{fast * 1000:>10.2f}{legacy / fast:>9.1f}x{difference:>12.4f}"
+        )
+
+    print("-" * 96)
+    print(
+        f"{'total':<44}{'':>10}{totals['legacy'] * 1000:>10.2f}"
+        f"{totals['fast'] * 1000:>10.2f}{totals['legacy'] / totals['fast']:>9.1f}x"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# bench_startup.py
+"""
+Cold-start benchmark for the serving backends.
+
+Every run happens in a fresh interpreter, so import costs are real. Reports
+import time, model-load time and first-inference time separately.
+
+Usage: python bench_startup.py [--backend keras tflite] [--runs 5] [--output FILE]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+STAGES = ["import", "load", "first_inference", "second_inference"]
+
+
+def measure(backend, model_path=None):
+    """Time each cold-start stage of one backend in this (fresh) process"""
+    timings = {}
+
+    start = time.perf_counter()
+    import numpy as np
+    import backends
+
+    backends.import_runtime(backend)
+    timings["import"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    model = backends.create_backend(backend, model_path)
+    timings["load"] = time.perf_counter() - start
+
+    image = np.zeros((1, *model.input_size, 3), np.float32)
+    for stage in ["first_inference", "second_inference"]:
+        start = time.perf_counter()
+        model.predict(image)
+        timings[stage] = time.perf_counter() - start
+
+    return timings
+
+
+def run_child(backend, model_path=None):
+    """Measure one backend in a new Python process"""
+    command = [sys.executable, os.path.abspath(__file__), "--child", backend]
+    if model_path:
+        command += ["--model", model_path]
+
+    start = time.perf_counter()
+    output = subprocess.run(
+        command,
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    ).stdout
+    total = time.perf_counter() - start
+
+    timings = json.loads(output.strip().splitlines()[-1])
+    timings["process_total"] = total
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark backend cold start")
+    parser.add_argument("--backend", nargs="+", default=["keras", "tflite"])
+    parser.add_argument("--model", help="Model file (only with a single backend)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child, args.model)))
+        return
+
+    results = {}
+    for backend in args.backend:
+        print(f"Benchmarking {backend} ({args.runs} runs)...")
+        runs = [run_child(backend, args.model) for _ in range(args.runs)]
+        results[backend] = {
+            stage: statistics.median(run[stage] for run in runs)
+            for stage in STAGES + ["process_total"]
+        }
+
+    print("\nMedian cold-start times (ms):")
+    print("-" * 108)
+    header = ["backend"] + STAGES + ["process_total"]
+    print("".join(f"{name:>18}" for name in header))
+    for backend, timings in results.items():
+        row = [backend] + [f"{timings[stage] * 1000:.1f}" for stage in header[1:]]
+        print("".join(f"{value:>18}" for value in row))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+# build_shards.py
+"""
+One-time conversion of the hybrid dataset into TFRecord shards of images
+already center-cropped and resized to the training size, stored as raw uint8
+pixels with their labels. Training then reads these instead of decoding the
+original full-size JPEGs every epoch.
+
+Usage: python build_shards.py [--data-dir ../data/hybrid_dataset]
+           [--output ../data/hybrid_shards] [--img-size 224]
+"""
+import argparse
+
+from dataset import FoodDataset
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build pre-resized dataset shards")
+    parser.add_argument("--data-dir", default="../data/hybrid_dataset")
+    parser.add_argument("--output", default="../data/hybrid_shards")
+    parser.add_argument("--img-size", type=int, default=224)
+    parser.add_argument(
+        "--images-per-shard",
+        type=int,
+        default=1000,
+        help="About 150MB per shard at 224px",
+    )
+    parser.add_argument(
+        "--splits", nargs="+", default=["training", "validation", "evaluation"]
+    )
+    args = parser.parse_args()
+
+    dataset = FoodDataset(args.data_dir, (args.img_size, args.img_size))
+    for split in args.splits:
+        dataset.build_shards(split, args.output, args.images_per_shard)
+
+
+if __name__ == "__main__":
+    print("Building dataset shards...")
+    main()
+    print("\nDone!")
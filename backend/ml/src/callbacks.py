@@ -0,0 +1,196 @@
+# callbacks.py
+import json
+import os
+import resource
+import time
+
+import numpy as np
+import tensorflow as tf
+
+
+class ThroughputCallback(tf.keras.callbacks.Callback):
+    """
+    Measures training throughput in images per second for each epoch, adding
+    it to the epoch logs (and so to the History) as images_per_sec.
+
+    The first epoch includes tracing and, with XLA, compilation, so the
+    summary printed at the end of training leaves it out when it can.
+    """
+
+    def __init__(self, batch_size: int, num_images: int = None, label: str = ""):
+        """
+        Args:
+            batch_size: Images per training step
+            num_images: Images per epoch, to count the last partial batch exactly
+            label: Configuration name used in the summary line
+        """
+        super().__init__()
+        self.batch_size = batch_size
+        self.num_images = num_images
+        self.label = label
+        self.rates = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.steps = 0
+        self.start = self.end = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.steps += 1
+        self.end = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        # Up to the last training step, so validation time is not counted
+        elapsed = self.end - self.start
+        images = self.steps * self.batch_size
+        if self.num_images:
+            images = min(images, self.num_images)
+
+        rate = images / elapsed if elapsed > 0 else 0.0
+        self.rates.append(rate)
+        if logs is not None:
+            logs["images_per_sec"] = rate
+
+    def steady_rate(self) -> float:
+        """Mean images per second, excluding the first epoch if possible"""
+        rates = self.rates[1:] or self.rates
+        return sum(rates) / len(rates) if rates else 0.0
+
+    def on_train_end(self, logs=None):
+        print(
+            f"\nThroughput ({self.label or 'training'}): "
+            f"{self.steady_rate():.1f} images/sec over {len(self.rates)} epochs"
+        )
+
+
+class ProfilerCallback(tf.keras.callbacks.Callback):
+    """
+    Per-epoch training profile written to a JSON file after every epoch:
+    step times, images per second, peak RSS and an estimate of whether the
+    input pipeline or the model limits throughput.
+
+    Keras reads the next batch inside the compiled train step, so waiting on
+    input cannot be timed from a callback. Instead, after the first epoch
+    (when any decode cache is complete) the input pipeline is run alone for
+    probe_batches batches; if producing a batch takes about as long as a
+    whole training step, input is the limit. The probe runs only once, since
+    each run refills the shuffle buffer, and later epochs are compared
+    against its result.
+
+    Optionally records a TensorFlow profiler trace of steps
+    [trace_steps[0], trace_steps[1]) counted across epochs, for TensorBoard.
+    """
+
+    def __init__(
+        self,
+        batch_size: int,
+        summary_path: str,
+        probe_dataset=None,
+        probe_batches: int = 20,
+        trace_dir: str = None,
+        trace_steps=(10, 20),
+    ):
+        super().__init__()
+        self.batch_size = batch_size
+        self.summary_path = summary_path
+        self.probe_dataset = probe_dataset
+        self.probe_batches = probe_batches
+        self.trace_dir = trace_dir
+        self.trace_steps = trace_steps
+        self.global_step = 0
+        self.probe = None
+        self.tracing = False
+        self.epochs = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.step_times = []
+        self.gaps = []
+        self.last_end = None
+
+    def on_train_batch_begin(self, batch, logs=None):
+        if self.trace_dir and self.global_step == self.trace_steps[0]:
+            tf.profiler.experimental.start(self.trace_dir)
+            self.tracing = True
+        self.begin = time.perf_counter()
+        if self.last_end is not None:
+            # Time spent outside the train step: callbacks, logging
+            self.gaps.append(self.begin - self.last_end)
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.last_end = time.perf_counter()
+        self.step_times.append(self.last_end - self.begin)
+        self.global_step += 1
+        if self.tracing and self.global_step >= self.trace_steps[1]:
+            self._stop_trace()
+
+    def _stop_trace(self):
+        tf.profiler.experimental.stop()
+        self.tracing = False
+        print(f"\nProfiler trace written to {self.trace_dir}")
+
+    def probe_input(self):
+        """Seconds to the first batch and per later batch, input pipeline only"""
+        iterator = iter(self.probe_dataset.take(self.probe_batches + 1))
+        start = time.perf_counter()
+        next(iterator)  # Includes filling shuffle and prefetch buffers
+        first = time.perf_counter()
+        batches = sum(1 for _ in iterator)
+        end = time.perf_counter()
+        return first - start, (end - first) / batches if batches else None
+
+    def on_epoch_end(self, epoch, logs=None):
+        steps = np.array(self.step_times) * 1000
+        summary = {
+            "epoch": epoch + 1,
+            "steps": len(steps),
+            "step_ms": {
+                "mean": float(steps.mean()) if len(steps) else 0.0,
+                "p50": float(np.percentile(steps, 50)) if len(steps) else 0.0,
+                "p90": float(np.percentile(steps, 90)) if len(steps) else 0.0,
+                "max": float(steps.max()) if len(steps) else 0.0,
+            },
+            "host_gap_ms": float(np.mean(self.gaps) * 1000) if self.gaps else 0.0,
+            "images_per_sec": (
+                len(steps) * self.batch_size / (steps.sum() / 1000)
+                if steps.sum()
+                else 0.0
+            ),
+            # ru_maxrss is in kilobytes on Linux
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        }
+
+        if self.probe_dataset is not None and len(steps):
+            if self.probe is None:
+                self.probe = self.probe_input()
+            startup, per_batch = self.probe
+            summary["input_startup_s"] = startup
+            if per_batch is not None:
+                # Median step: the mean is skewed by the first, tracing step
+                input_share = per_batch * 1000 / summary["step_ms"]["p50"]
+                summary["input_batch_ms"] = per_batch * 1000
+                summary["input_share"] = input_share
+                summary["bottleneck"] = "input" if input_share >= 0.9 else "compute"
+
+        if logs is not None:
+            summary["logs"] = {key: float(value) for key, value in logs.items()}
+        self.epochs.append(summary)
+
+        tmp_path = f"{self.summary_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"epochs": self.epochs}, f, indent=2)
+        os.replace(tmp_path, self.summary_path)
+
+        print(
+            f"\nProfile: {summary['step_ms']['p50']:.1f} ms/step, "
+            f"{summary['images_per_sec']:.1f} images/sec, "
+            f"peak RSS {summary['peak_rss_mb']:.0f} MB"
+            + (
+                f", input {summary['input_batch_ms']:.1f} ms/batch "
+                f"({summary['bottleneck']} bound)"
+                if "bottleneck" in summary
+                else ""
+            )
+        )
+
+    def on_train_end(self, logs=None):
+        if self.tracing:
+            self._stop_trace()
@@ -0,0 +1,295 @@
+# compress_model.py
+"""
+Optional compression stage between train.py and convert_to_tflite.py:
+magnitude pruning to a target sparsity, fine-tuned while the sparsity ramps
+up, then optionally weight clustering (sparsity-preserving), then export.
+
+Zeroed and clustered weights do not make the .tflite smaller by themselves,
+but they compress well, and the app download is gzip-compressed. The report
+compares the compressed and the original model (both converted the same
+way) on gzip size, CPU latency and evaluation accuracy.
+
+Requires tensorflow-model-optimization (pip install
+tensorflow-model-optimization), which training and serving do not need.
+
+Usage: python compress_model.py [--sparsity 0.5] [--prune-epochs 4]
+           [--clusters 16] [--model ../model/model_latest.h5]
+"""
+import argparse
+import gzip
+import os
+
+import tensorflow as tf
+
+import train
+from convert_to_tflite import convert_model, evaluate_variants
+
+MODEL_PATH = "../model/model_latest.h5"
+OUTPUT_PATH = "../model/model_compressed.h5"
+
+# Layers whose kernels are pruned and clustered
+COMPRESSIBLE = (
+    tf.keras.layers.Conv2D,
+    tf.keras.layers.DepthwiseConv2D,
+    tf.keras.layers.Dense,
+)
+
+
+def import_tfmot():
+    try:
+        import tensorflow_model_optimization as tfmot
+    except ImportError as e:
+        raise ImportError(
+            "compress_model.py needs tensorflow-model-optimization: "
+            "pip install tensorflow-model-optimization"
+        ) from e
+    return tfmot
+
+
+def clone_with(model, wrap):
+    """
+    Clone model, replacing each layer by wrap(layer). Nested models (the
+    MobileNetV2 backbone inside the Sequential) are cloned layer by layer
+    too, since the tfmot wrappers only accept single layers. Layers that are
+    not wrapped are reused with their weights.
+    """
+
+    def clone_layer(layer):
+        if isinstance(layer, tf.keras.Model):
+            return tf.keras.models.clone_model(layer, clone_function=clone_layer)
+        return wrap(layer)
+
+    return tf.keras.models.clone_model(model, clone_function=clone_layer)
+
+
+def compressible_layers(model, skip_output=True):
+    """Names of the Conv2D/DepthwiseConv2D/Dense layers, nested ones included"""
+    names = []
+    for layer in model.layers:
+        if isinstance(layer, tf.keras.Model):
+            names += compressible_layers(layer, skip_output=False)
+        elif isinstance(layer, COMPRESSIBLE):
+            names.append(layer.name)
+    if skip_output and names and model.layers[-1].name == names[-1]:
+        # The 3-way classifier is tiny and the most sensitive layer
+        names.pop()
+    return names
+
+
+def unfreeze(model):
+    """
+    Make every layer trainable, so that all weights may move to compensate
+    for the removed ones (and clustering, which only takes trainable kernels,
+    reaches the frozen backbone), except the BatchNormalization statistics,
+    which small fine-tuning batches would skew
+    """
+    model.trainable = True
+    for layer in iter_layers(model):
+        if isinstance(layer, tf.keras.layers.BatchNormalization):
+            layer.trainable = False
+
+
+def compile_for_fine_tuning(model, learning_rate):
+    unfreeze(model)
+    model.compile(
+        optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate),
+        loss="categorical_crossentropy",
+        metrics=["accuracy"],
+    )
+
+
+def iter_layers(model):
+    for layer in model.layers:
+        if isinstance(layer, tf.keras.Model):
+            yield from iter_layers(layer)
+        else:
+            yield layer
+
+
+def prune(model, data, args):
+    """Prune to args.sparsity, ramping up over all but the last epoch"""
+    tfmot = import_tfmot()
+    sparsity = tfmot.sparsity.keras
+    train_ds, val_ds, class_weights, steps_per_epoch = data
+
+    ramp_epochs = max(1, args.prune_epochs - 1)
+    schedule = sparsity.PolynomialDecay(
+        initial_sparsity=0.0,
+        final_sparsity=args.sparsity,
+        begin_step=0,
+        end_step=ramp_epochs * steps_per_epoch,
+        frequency=max(1, steps_per_epoch // 4),
+    )
+    unfreeze(model)
+    targets = set(compressible_layers(model))
+    pruned = clone_with(
+        model,
+        lambda layer: (
+            sparsity.prune_low_magnitude(layer, pruning_schedule=schedule)
+            if layer.name in targets
+            else layer
+        ),
+    )
+    compile_for_fine_tuning(pruned, args.learning_rate)
+
+    print(f"\nPruning {len(targets)} layers to {args.sparsity:.0%} sparsity...")
+    pruned.fit(
+        train_ds,
+        validation_data=val_ds,
+        epochs=args.prune_epochs,
+        callbacks=[sparsity.UpdatePruningStep()],
+        class_weight=class_weights,
+    )
+    return sparsity.strip_pruning(pruned)
+
+
+def cluster(model, data, args, preserve_sparsity):
+    """Share args.clusters distinct values per layer, fine-tuned briefly"""
+    tfmot = import_tfmot()
+    clustering = tfmot.clustering.keras
+    train_ds, val_ds, class_weights, _ = data
+
+    params = {
+        "number_of_clusters": args.clusters,
+        "cluster_centroids_init": clustering.CentroidInitialization.KMEANS_PLUS_PLUS,
+    }
+    cluster_weights = clustering.cluster_weights
+    if preserve_sparsity:
+        # Keeps the zeros from pruning as their own, fixed cluster. Only
+        # exposed under this path, as in tfmot's sparsity-preserving guide.
+        from tensorflow_model_optimization.python.core.clustering.keras.experimental import (
+            cluster as experimental_cluster,
+        )
+
+        cluster_weights = experimental_cluster.cluster_weights
+        params["preserve_sparsity"] = True
+
+    unfreeze(model)
+    targets = set(compressible_layers(model))
+    clustered = clone_with(
+        model,
+        lambda layer: (
+            cluster_weights(layer, **params) if layer.name in targets else layer
+        ),
+    )
+    compile_for_fine_tuning(clustered, args.learning_rate / 10)
+
+    print(f"\nClustering {len(targets)} layers into {args.clusters} clusters...")
+    clustered.fit(
+        train_ds,
+        validation_data=val_ds,
+        epochs=args.cluster_epochs,
+        class_weight=class_weights,
+    )
+    return clustering.strip_clustering(clustered)
+
+
+def measure_sparsity(model):
+    """Fraction of zero weights in the kernels of the compressible layers"""
+    zeros = total = 0
+    for layer in iter_layers(model):
+        if isinstance(layer, COMPRESSIBLE):
+            kernel = layer.get_weights()[0]
+            zeros += int((kernel == 0).sum())
+            total += kernel.size
+    return zeros / max(total, 1)
+
+
+def rebuild(model):
+    """
+    Copy of a model with its own layers and weights. Also gives a stripped
+    model back proper weight names: strip_pruning/strip_clustering recreate
+    layers outside their name scopes, so weights of the nested backbone end
+    up with clashing plain names ("kernel:0") that an .h5 file cannot hold.
+    """
+    fresh = tf.keras.models.clone_model(model)
+    fresh.set_weights(model.get_weights())
+    return fresh
+
+
+def gzip_size(path):
+    with open(path, "rb") as f:
+        return len(gzip.compress(f.read(), compresslevel=9))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prune and cluster the model")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--output", default=OUTPUT_PATH)
+    parser.add_argument("--sparsity", type=float, default=0.5)
+    parser.add_argument("--prune-epochs", type=int, default=4)
+    parser.add_argument(
+        "--clusters", type=int, default=0, help="Weights per layer; 0 to skip"
+    )
+    parser.add_argument("--cluster-epochs", type=int, default=2)
+    parser.add_argument("--learning-rate", type=float, default=1e-5)
+    parser.add_argument(
+        "--variant",
+        choices=["float32", "dynamic", "float16"],
+        default="dynamic",
+        help="TFLite conversion for both models in the report",
+    )
+    parser.add_argument("--threads", type=int, help="TFLite interpreter threads")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        raise FileNotFoundError(f"Model file not found at {args.model}")
+    import_tfmot()  # Fail before any training when it is missing
+
+    original = tf.keras.models.load_model(args.model)
+    img_size = tuple(original.input_shape[1:3])
+    dataset = train.load_food_dataset(img_size, train.BATCH_SIZE)
+    data = (
+        dataset.create_dataset("training", train.cache_file("training", img_size)),
+        dataset.create_dataset("validation", train.cache_file("validation", img_size)),
+        dataset.get_class_weights("training"),
+        -(-dataset.count_images("training") // train.BATCH_SIZE),
+    )
+
+    # The tfmot wrappers train the layers they wrap, so work on a copy and
+    # keep the original intact for the comparison
+    compressed = rebuild(original)
+    if args.sparsity > 0:
+        compressed = prune(compressed, data, args)
+    if args.clusters:
+        compressed = cluster(compressed, data, args, args.sparsity > 0)
+    compressed = rebuild(compressed)
+    compressed.compile(
+        optimizer="adam", loss="categorical_crossentropy", metrics=["accuracy"]
+    )
+    compressed.save(args.output)
+    print(f"\nCompressed model saved to {args.output}")
+    print(f"Weight sparsity: {measure_sparsity(compressed):.1%}")
+
+    stem = os.path.splitext(args.output)[0]
+    paths = {
+        "original": f"{stem}_original_{args.variant}.tflite",
+        "compressed": f"{stem}_{args.variant}.tflite",
+    }
+    for name, model in (("original", original), ("compressed", compressed)):
+        with open(paths[name], "wb") as f:
+            f.write(convert_model(model, args.variant))
+
+    report, num_images = evaluate_variants(
+        original, paths, img_size, num_threads=args.threads
+    )
+
+    print(f"\nEvaluation split: {num_images} images, {args.variant} TFLite")
+    sizes = {name: gzip_size(path) / (1024 * 1024) for name, path in paths.items()}
+    before, after = report["original"], report["compressed"]
+    print(f"{'':<12}{'gzip MB':>10}{'p50 ms':>10}{'accuracy':>10}")
+    for name in paths:
+        print(
+            f"{name:<12}{sizes[name]:>10.2f}"
+            f"{report[name]['latency_p50_ms']:>10.2f}{report[name]['accuracy']:>10.4f}"
+        )
+    print(
+        f"{'delta':<12}{sizes['compressed'] - sizes['original']:>+10.2f}"
+        f"{after['latency_p50_ms'] - before['latency_p50_ms']:>+10.2f}"
+        f"{after['accuracy'] - before['accuracy']:>+10.4f}"
+    )
+    print(f"Top-1 agreement with the original: {after['agreement']:.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,52 +1,268 @@
 # backend/ml/src/convert_to_tflite_simple.py
-import tensorflow as tf
+"""
+Convert the Keras model to TFLite in one or more quantization variants:
+
+    float32  no quantization
+    dynamic  int8 weights, float activations (Optimize.DEFAULT alone)
+    float16  float16 weights, float activations
+    int8     full-integer: int8 weights and activations, calibrated on a
+             representative sample of the validation split
+
+Each variant is written next to the model as model_latest_<variant>.tflite
+and reported with its size, CPU latency and top-1 agreement with the Keras
+model on the evaluation split (skipped with --no-eval, or when there is no
+evaluation split). The --deploy variant (by default the first one
+converted) is also written to model_latest.tflite, the file api.py serves.
+
+Usage: python convert_to_tflite.py [--variants dynamic int8 float16]
+           [--io uint8] [--deploy int8] [--model ../model/model_latest.h5]
+"""
+import argparse
 import os
+import time
+
+import numpy as np
+
+DATA_DIR = "../data/hybrid_dataset"
+MODEL_PATH = "../model/model_latest.h5"
+OUTPUT_PATH = "../model/model_latest.tflite"
+
+VARIANTS = ["float32", "dynamic", "float16", "int8"]
+
+
+def representative_images(img_size, num_images=200):
+    """
+    Generator factory for calibration: num_images single-image batches drawn
+    at random (with a fixed seed) from every class of the validation split,
+    scaled to [0, 1] like the model's real inputs
+    """
+    from dataset import FoodDataset
+
+    dataset = FoodDataset(DATA_DIR, img_size, batch_size=1).create_sample(
+        "validation", num_images
+    )
+
+    def generate():
+        for images, _ in dataset:
+            yield [images]
+
+    return generate
+
+
+def convert_model(model, variant, io_type="float32", representative_dataset=None):
+    """
+    Convert a Keras model to a TFLite flatbuffer. io_type sets the input and
+    output type of the int8 variant; uint8 inputs take raw pixel values,
+    since the calibrated input scale comes out as 1/255.
+    """
+    import tensorflow as tf
+
+    # Create a concrete function from the model
+    concrete_func = tf.function(model).get_concrete_function(
+        tf.TensorSpec(model.input_shape, tf.float32)
+    )
+    converter = tf.lite.TFLiteConverter.from_concrete_functions([concrete_func])
+
+    if variant != "float32":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if variant == "float16":
+        converter.target_spec.supported_types = [tf.float16]
+
+    if variant == "int8":
+        if representative_dataset is None:
+            raise ValueError("The int8 variant needs a representative dataset")
+        converter.representative_dataset = representative_dataset
+        # Fail rather than silently leave float ops in the graph
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        if io_type != "float32":
+            converter.inference_input_type = getattr(tf, io_type)
+            converter.inference_output_type = getattr(tf, io_type)
+    else:
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS]
+
+    return converter.convert()
 
 
-def convert_model_simple():
+def measure_latency(backend, image, runs=50):
+    """Median and p95 latency in ms of single-image inference"""
+    backend.predict(image)
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        backend.predict(image)
+        times.append(time.perf_counter() - start)
+    return np.percentile(times, 50) * 1000, np.percentile(times, 95) * 1000
+
+
+def evaluate_variants(model, paths, img_size, num_threads=None, max_images=None):
+    """
+    Top-1 agreement with the Keras model and accuracy of every variant over
+    the evaluation split, plus single-image CPU latency
+    """
+    from backends import TFLiteBackend
+    from dataset import FoodDataset
+
+    interpreters = {
+        variant: TFLiteBackend(path, num_threads=num_threads)
+        for variant, path in paths.items()
+    }
+    dataset = FoodDataset(DATA_DIR, img_size).create_dataset(
+        "evaluation", augment=False
+    )
+
+    labels, keras_top1 = [], []
+    top1 = {variant: [] for variant in interpreters}
+    seen = 0
+    for images, one_hot in dataset:
+        images = images.numpy()
+        if max_images is not None:
+            images, one_hot = images[: max_images - seen], one_hot[: max_images - seen]
+        labels.append(np.argmax(one_hot, axis=1))
+        keras_top1.append(np.argmax(model.predict_on_batch(images), axis=1))
+        for variant, backend in interpreters.items():
+            top1[variant].append(np.argmax(backend.predict(images), axis=1))
+        seen += len(images)
+        if max_images is not None and seen >= max_images:
+            break
+
+    labels, keras_top1 = np.concatenate(labels), np.concatenate(keras_top1)
+    single_image = np.zeros((1, *img_size, 3), np.float32)
+    if len(images):
+        single_image = images[:1]
+
+    report = {"keras": {"accuracy": float(np.mean(keras_top1 == labels))}}
+    for variant, backend in interpreters.items():
+        predicted = np.concatenate(top1[variant])
+        p50, p95 = measure_latency(backend, single_image)
+        report[variant] = {
+            "agreement": float(np.mean(predicted == keras_top1)),
+            "accuracy": float(np.mean(predicted == labels)),
+            "latency_p50_ms": p50,
+            "latency_p95_ms": p95,
+        }
+    return report, len(labels)
+
+
+def convert_models(
+    model_path=MODEL_PATH,
+    variants=("dynamic",),
+    io_type="float32",
+    deploy="dynamic",
+    output_path=OUTPUT_PATH,
+    calibration_images=200,
+    num_threads=None,
+    max_eval_images=None,
+    evaluate=True,
+):
     try:
         # Load your existing model
         print("Loading model...")
-        model_path = "../model/model_latest.h5"
         if not os.path.exists(model_path):
             raise FileNotFoundError(f"Model file not found at {model_path}")
+        if deploy and deploy not in variants:
+            raise ValueError(f"--deploy {deploy} is not one of the converted variants")
+
+        # Imported after the cheap checks so a bad path fails fast
+        import tensorflow as tf
 
         model = tf.keras.models.load_model(model_path)
+        img_size = tuple(model.input_shape[1:3])
         print("Model loaded successfully")
 
-        # Create a concrete function from the model
-        print("Creating concrete function...")
-        input_shape = model.input_shape
-        concrete_func = tf.function(model).get_concrete_function(
-            tf.TensorSpec(input_shape, tf.float32)
-        )
+        representative_dataset = None
+        if "int8" in variants:
+            representative_dataset = representative_images(img_size, calibration_images)
 
-        # Convert using from_concrete_functions
-        print("Converting model...")
-        converter = tf.lite.TFLiteConverter.from_concrete_functions([concrete_func])
+        paths = {}
+        stem = os.path.splitext(output_path)[0]
+        for variant in variants:
+            print(f"Converting model ({variant})...")
+            tflite_model = convert_model(
+                model, variant, io_type, representative_dataset
+            )
+            paths[variant] = f"{stem}_{variant}.tflite"
+            with open(paths[variant], "wb") as f:
+                f.write(tflite_model)
+            if variant == deploy:
+                with open(output_path, "wb") as f:
+                    f.write(tflite_model)
+                print(f"Deployed {variant} model to {output_path}")
 
-        # Basic settings
-        converter.optimizations = [tf.lite.Optimize.DEFAULT]
-        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS]
+        if not evaluate:
+            return None
+        if not os.path.isdir(os.path.join(DATA_DIR, "evaluation")):
+            print(
+                f"\nWarning: No evaluation split in {DATA_DIR}, "
+                "skipping the evaluation"
+            )
+            return None
 
-        tflite_model = converter.convert()
-
-        # Save the converted model
-        output_path = "../model/model_latest.tflite"
-        with open(output_path, "wb") as f:
-            f.write(tflite_model)
+        print("\nEvaluating against the Keras model...")
+        report, num_images = evaluate_variants(
+            model, paths, img_size, num_threads, max_eval_images
+        )
 
-        print(f"Model converted successfully and saved to {output_path}")
+        print(f"\nEvaluation split: {num_images} images")
         print(
-            f"Original model size: {os.path.getsize(model_path) / (1024*1024):.2f} MB"
+            f"Keras model: {os.path.getsize(model_path) / (1024*1024):.2f} MB, "
+            f"accuracy {report['keras']['accuracy']:.4f}"
         )
-        print(f"TFLite model size: {os.path.getsize(output_path) / (1024*1024):.2f} MB")
+        print(
+            f"{'variant':<10}{'size MB':>10}{'p50 ms':>10}{'p95 ms':>10}"
+            f"{'agreement':>12}{'accuracy':>10}"
+        )
+        for variant, path in paths.items():
+            row = report[variant]
+            print(
+                f"{variant:<10}{os.path.getsize(path) / (1024*1024):>10.2f}"
+                f"{row['latency_p50_ms']:>10.2f}{row['latency_p95_ms']:>10.2f}"
+                f"{row['agreement']:>12.4f}{row['accuracy']:>10.4f}"
+            )
+        return report
 
     except Exception as e:
         print(f"Error during conversion: {str(e)}")
         raise
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Convert the model to TFLite")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--output", default=OUTPUT_PATH)
+    parser.add_argument("--variants", nargs="+", choices=VARIANTS, default=["dynamic"])
+    parser.add_argument(
+        "--io",
+        choices=["float32", "uint8", "int8"],
+        default="float32",
+        help="Input and output type of the int8 variant",
+    )
+    parser.add_argument(
+        "--deploy",
+        help="Variant also written to --output (default: the first of "
+        "--variants); 'none' to leave it untouched",
+    )
+    parser.add_argument("--calibration-images", type=int, default=200)
+    parser.add_argument("--threads", type=int, help="TFLite interpreter threads")
+    parser.add_argument("--max-eval-images", type=int)
+    parser.add_argument(
+        "--no-eval",
+        action="store_true",
+        help="Only convert, without the evaluation split comparison",
+    )
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
+    args = parse_args()
     print("Starting model conversion...")
-    convert_model_simple()
+    convert_models(
+        args.model,
+        args.variants,
+        args.io,
+        None if args.deploy == "none" else args.deploy or args.variants[0],
+        args.output,
+        args.calibration_images,
+        args.threads,
+        args.max_eval_images,
+        not args.no_eval,
+    )
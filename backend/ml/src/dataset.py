@@ -1,8 +1,22 @@
 # dataset.py
 import tensorflow as tf
+import glob
+import hashlib
 import os
+import json
 import numpy as np
-from typing import Tuple, Dict
+from typing import Tuple, Dict, List
+
+from dataset_index import DatasetIndex
+from validation import check_images
+
+# Name of the file describing a split's shards, written after the shards
+SHARD_META = "meta.json"
+
+SHARD_FEATURES = {
+    "image": tf.io.FixedLenFeature([], tf.string),
+    "label": tf.io.FixedLenFeature([], tf.int64),
+}
 
 
 class FoodDataset:
@@ -11,6 +25,10 @@ class FoodDataset:
         data_dir: str,
         img_size: Tuple[int, int] = (224, 224),
         batch_size: int = 32,
+        shard_dir: str = None,
+        num_workers: int = 1,
+        worker_index: int = 0,
+        refresh: bool = True,
     ):
         """
         Initialize FoodDataset with enhanced preprocessing and validation
@@ -19,40 +37,86 @@ class FoodDataset:
             data_dir: Root directory of the dataset
             img_size: Target size for images (height, width)
             batch_size: Batch size for training
+            shard_dir: Directory of shards from build_shards, read instead of
+                the original images when set
+            num_workers: Number of training processes; create_dataset then
+                yields only this worker's share of each split
+            worker_index: Which share, from 0 to num_workers - 1
+            refresh: Bring the index up to date on first use. Processes
+                started together over one tree (training workers) leave it
+                to their launcher, so they do not all rescan it at once.
         """
         self.data_dir = data_dir
         self.img_size = img_size
         self.batch_size = batch_size
+        self.shard_dir = shard_dir
+        self.num_workers = num_workers
+        self.worker_index = worker_index
+        self.refresh = refresh
         self.categories = ["non_food", "healthy_food", "unhealthy_food"]
-
-    def _parse_image(
-        self, filename: tf.Tensor, label: tf.Tensor
-    ) -> Tuple[tf.Tensor, tf.Tensor]:
+        self.splits = ["training", "validation", "evaluation"]
+        self._index = None
+
+    @property
+    def index(self) -> DatasetIndex:
+        """Index of the image tree, refreshed once per FoodDataset"""
+        if self._index is None:
+            self._index = DatasetIndex(self.data_dir, self.categories, self.splits)
+            scanned = self._index.refresh() if self.refresh else 0
+            if scanned:
+                print(f"Indexed {scanned} changed directories in {self.data_dir}")
+        return self._index
+
+    def _split_files(self, split: str) -> Tuple[List[str], np.ndarray, int]:
         """
-        Enhanced image parsing with robust augmentation and preprocessing
+        Absolute paths and labels of a split's usable images from the index,
+        and how many were left out as corrupted by validate_dataset
         """
-        # Convert filename to string
-        filename = tf.cast(filename, tf.string)
-        label = tf.cast(label, tf.int32)
+        rel_paths, labels = self.index.files(split)
+        excluded_count = len(self.index.validation(split)[1])
+        paths = [os.path.join(self.data_dir, path) for path in rel_paths]
+        return paths, labels, excluded_count
 
-        # Read and decode image
+    def fingerprint(self, split: str) -> str:
+        """
+        Short hash of a split's ordered file list, with each image's label,
+        size and mtime: changes whenever images are added, removed, excluded
+        or rewritten
+        """
+        image_files, labels, _ = self._split_files(split)
+        stats = self.index.stats(split)
+        prefix = len(os.path.join(self.data_dir, ""))
+        digest = hashlib.sha1()
+        for path, label in zip(image_files, labels):
+            rel_path = path[prefix:]
+            digest.update(f"{rel_path}\0{label}\0{stats.get(rel_path)}\n".encode())
+        return digest.hexdigest()[:12]
+
+    def cache_path(self, split: str, cache_file: str) -> str:
+        """
+        The file create_dataset actually caches a split in for cache_file:
+        cache_file plus the split's fingerprint, so a changed file list never
+        replays a cache of the old one
+        """
+        return f"{cache_file}.{self.fingerprint(split)}"
+
+    def _remove_stale_caches(self, cache_path: str):
+        """Delete the caches of cache_path's prefix for other file lists"""
+        prefix, current = os.path.splitext(cache_path)
+        for path in glob.glob(f"{glob.escape(prefix)}.*"):
+            if not os.path.basename(path).startswith(
+                os.path.basename(prefix) + current
+            ):
+                os.remove(path)
+
+    def _decode_and_resize(self, filename: tf.Tensor) -> tf.Tensor:
+        """
+        Deterministic part of loading an image: decode, center crop to a square
+        and resize to img_size, returned as uint8 so it can be stored in shards
+        """
         image = tf.io.read_file(filename)
-        image = tf.image.decode_jpeg(image, channels=3)
-
-        # Enhanced data augmentation pipeline
-        image = tf.cast(image, tf.float32)
-
-        # Random augmentations for training diversity
-        image = tf.image.random_brightness(image, 0.2)
-        image = tf.image.random_contrast(image, 0.8, 1.2)
-        image = tf.image.random_saturation(image, 0.8, 1.2)
-        image = tf.image.random_hue(image, 0.1)
-        image = tf.image.random_flip_left_right(image)
-
-        # 50% chance of additional augmentations
-        if tf.random.uniform([]) > 0.5:
-            image = tf.image.transpose(image)
-            image = tf.image.random_flip_up_down(image)
+        # decode_image also handles the PNGs that _list_images accepts
+        image = tf.io.decode_image(image, channels=3, expand_animations=False)
 
         # Center crop before resize for consistent aspect ratio
         shape = tf.shape(image)
@@ -61,111 +125,382 @@ class FoodDataset:
 
         # Resize to target size
         image = tf.image.resize(image, self.img_size)
+        image = tf.clip_by_value(tf.round(image), 0.0, 255.0)
+        return tf.cast(image, tf.uint8)
 
-        # Normalize pixel values
-        image = tf.clip_by_value(image, 0.0, 255.0)
-        image = image / 255.0
-
-        # Convert label to one-hot encoding
-        label = tf.one_hot(label, 3)
+    def _normalize_batch(
+        self, images: tf.Tensor, labels: tf.Tensor
+    ) -> Tuple[tf.Tensor, tf.Tensor]:
+        """Scale a uint8 batch to [0, 1] and one-hot encode its labels"""
+        images = tf.cast(images, tf.float32) / 255.0
+        return images, tf.one_hot(labels, len(self.categories))
 
-        return image, label
+    def _with_targets(
+        self, images: tf.Tensor, one_hot: tf.Tensor, targets: tf.Tensor
+    ) -> Tuple[tf.Tensor, tf.Tensor]:
+        """Append per-image soft targets to a batch's one-hot labels"""
+        return images, tf.concat([one_hot, targets], axis=-1)
 
-    def create_dataset(self, split: str = "training") -> tf.data.Dataset:
+    def _augment_batch(
+        self, images: tf.Tensor, labels: tf.Tensor
+    ) -> Tuple[tf.Tensor, tf.Tensor]:
         """
-        Create dataset with enhanced error handling and logging
+        Random augmentation of a whole batch at once, with independent draws
+        per image: brightness, contrast, saturation, hue, horizontal flip and,
+        for half the images, a transpose plus a random vertical flip
         """
-        split_dir = os.path.join(self.data_dir, split)
+        images, labels = self._normalize_batch(images, labels)
+        batch = tf.shape(images)[0]
 
-        # Initialize containers
-        image_files = []
-        labels = []
-        category_counts = {category: 0 for category in self.categories}
+        def uniform(low, high, shape=(1, 1, 1)):
+            return tf.random.uniform((batch, *shape), low, high)
 
-        # Process each category
-        for label, category in enumerate(self.categories):
-            category_dir = os.path.join(split_dir, category)
+        def coin(p=0.5):
+            return tf.random.uniform((batch, 1, 1, 1)) < p
 
-            if not os.path.exists(category_dir):
-                print(f"Warning: Directory not found: {category_dir}")
-                continue
+        images = images + uniform(-0.2, 0.2)
+        mean = tf.reduce_mean(images, axis=[1, 2], keepdims=True)
+        images = (images - mean) * uniform(0.8, 1.2) + mean
+        images = tf.clip_by_value(images, 0.0, 1.0)
 
-            # Get all valid image files
-            valid_files = [
-                os.path.join(category_dir, f)
-                for f in os.listdir(category_dir)
-                if f.lower().endswith((".jpg", ".jpeg", ".png"))
-            ]
+        # Saturation and hue in one round trip through HSV
+        hue, saturation, value = tf.unstack(tf.image.rgb_to_hsv(images), axis=-1)
+        hue = tf.math.floormod(hue + uniform(-0.1, 0.1, (1, 1)), 1.0)
+        saturation = tf.clip_by_value(saturation * uniform(0.8, 1.2, (1, 1)), 0.0, 1.0)
+        images = tf.image.hsv_to_rgb(tf.stack([hue, saturation, value], axis=-1))
+
+        images = tf.where(coin(), tf.reverse(images, axis=[2]), images)
+        if self.img_size[0] == self.img_size[1]:
+            # Only a square image keeps its shape when transposed
+            transposed = tf.transpose(images, [0, 2, 1, 3])
+            transposed = tf.where(coin(), tf.reverse(transposed, axis=[1]), transposed)
+            images = tf.where(coin(), transposed, images)
 
-            category_counts[category] = len(valid_files)
-            image_files.extend(valid_files)
-            labels.extend([label] * len(valid_files))
+        return tf.clip_by_value(images, 0.0, 1.0), labels
+
+    def _list_images(self, split: str) -> Tuple[List[str], List[int]]:
+        """
+        List the image files of a split with their labels, printing statistics
+        """
+        image_files, labels, excluded_count = self._split_files(split)
+        category_counts = np.bincount(labels, minlength=len(self.categories))
 
         # Print dataset statistics
         print(f"\nDataset statistics for {split}:")
         print("-" * 50)
-        for category, count in category_counts.items():
+        for category, count in zip(self.categories, category_counts):
             print(f"{category}: {count} images")
-        print(f"Total: {sum(category_counts.values())} images")
+        print(f"Total: {len(image_files)} images")
+        if excluded_count:
+            print(f"Excluded: {excluded_count} corrupted images")
 
         # Verify dataset is not empty
         if not image_files:
+            split_dir = os.path.join(self.data_dir, split)
             raise ValueError(f"No images found in {split_dir}")
 
-        # Create TensorFlow dataset
-        dataset = tf.data.Dataset.from_tensor_slices(
-            (tf.constant(image_files), tf.constant(labels, dtype=tf.int32))
+        return image_files, labels.tolist()
+
+    def build_shards(
+        self, split: str, output_dir: str, images_per_shard: int = 1000
+    ) -> Dict:
+        """
+        Decode, crop and resize a split once into TFRecord shards of raw uint8
+        pixels, so training epochs never touch the original JPEGs again.
+
+        Shards are written to output_dir/split in a fixed shuffled order, with
+        a meta.json describing them written last; create_dataset reads them
+        when the FoodDataset is given output_dir as its shard_dir.
+        """
+        image_files, labels = self._list_images(split)
+
+        # Interleave the classes so a shuffle buffer never sees a single class
+        order = np.random.RandomState(0).permutation(len(image_files))
+        image_files = [image_files[i] for i in order]
+        labels = [labels[i] for i in order]
+
+        split_dir = os.path.join(output_dir, split)
+        os.makedirs(split_dir, exist_ok=True)
+        meta_path = os.path.join(split_dir, SHARD_META)
+        if os.path.exists(meta_path):
+            os.remove(meta_path)  # Shards being rewritten are not readable
+        for name in os.listdir(split_dir):
+            if name.endswith(".tfrecord"):
+                os.remove(os.path.join(split_dir, name))
+
+        # Decode in parallel; images that fail to decode are skipped
+        decoded = (
+            tf.data.Dataset.from_tensor_slices(
+                (tf.constant(image_files), tf.constant(labels, dtype=tf.int32))
+            )
+            .map(
+                lambda filename, label: (self._decode_and_resize(filename), label),
+                num_parallel_calls=tf.data.AUTOTUNE,
+            )
+            .apply(tf.data.experimental.ignore_errors())
+            .prefetch(tf.data.AUTOTUNE)
         )
 
-        # Configure dataset for performance
-        dataset = dataset.map(self._parse_image, num_parallel_calls=tf.data.AUTOTUNE)
+        shards = []
+        class_counts = [0] * len(self.categories)
+        writer = None
+        for index, (image, label) in enumerate(decoded.as_numpy_iterator()):
+            if index % images_per_shard == 0:
+                if writer is not None:
+                    writer.close()
+                shards.append(f"{split}-{len(shards):05d}.tfrecord")
+                writer = tf.io.TFRecordWriter(os.path.join(split_dir, shards[-1]))
+
+            example = tf.train.Example(
+                features=tf.train.Features(
+                    feature={
+                        "image": tf.train.Feature(
+                            bytes_list=tf.train.BytesList(value=[image.tobytes()])
+                        ),
+                        "label": tf.train.Feature(
+                            int64_list=tf.train.Int64List(value=[int(label)])
+                        ),
+                    }
+                )
+            )
+            writer.write(example.SerializeToString())
+            class_counts[label] += 1
+        if writer is not None:
+            writer.close()
+
+        meta = {
+            "img_size": list(self.img_size),
+            "categories": self.categories,
+            "count": sum(class_counts),
+            "class_counts": class_counts,
+            "skipped": len(image_files) - sum(class_counts),
+            "shards": shards,
+        }
+        with open(meta_path, "w") as f:
+            json.dump(meta, f, indent=2)
+
+        print(f"\nWrote {meta['count']} images to {len(shards)} shards in {split_dir}")
+        if meta["skipped"]:
+            print(f"Skipped {meta['skipped']} images that could not be decoded")
+        return meta
+
+    def _read_shard_meta(self, split: str) -> Dict:
+        meta_path = os.path.join(self.shard_dir, split, SHARD_META)
+        if not os.path.exists(meta_path):
+            raise FileNotFoundError(
+                f"No shards for {split} in {self.shard_dir}; run build_shards.py"
+            )
+        with open(meta_path) as f:
+            meta = json.load(f)
+
+        if tuple(meta["img_size"]) != tuple(self.img_size):
+            raise ValueError(
+                f"Shards in {self.shard_dir} are {tuple(meta['img_size'])}, "
+                f"not {tuple(self.img_size)}; rebuild them for this size"
+            )
+        if meta["categories"] != self.categories:
+            raise ValueError(f"Shards in {self.shard_dir} have other categories")
+        return meta
+
+    def _parse_shard_example(self, record: tf.Tensor) -> Tuple[tf.Tensor, tf.Tensor]:
+        features = tf.io.parse_single_example(record, SHARD_FEATURES)
+        image = tf.io.decode_raw(features["image"], tf.uint8)
+        image = tf.reshape(image, (*self.img_size, 3))
+        return image, tf.cast(features["label"], tf.int32)
+
+    def _shard_dataset(self, split: str) -> Tuple[tf.data.Dataset, int]:
+        """Resized uint8 images and labels read back from a split's shards"""
+        meta = self._read_shard_meta(split)
 
-        if split == "training":
-            # Shuffle training data with larger buffer
+        print(f"\nDataset statistics for {split} (shards):")
+        print("-" * 50)
+        for category, count in zip(self.categories, meta["class_counts"]):
+            print(f"{category}: {count} images")
+        print(f"Total: {meta['count']} images")
+
+        if not meta["count"]:
+            raise ValueError(f"No images found in {self.shard_dir}/{split}")
+
+        files = [os.path.join(self.shard_dir, split, name) for name in meta["shards"]]
+        dataset = tf.data.TFRecordDataset(files, num_parallel_reads=tf.data.AUTOTUNE)
+        dataset = dataset.map(
+            self._parse_shard_example, num_parallel_calls=tf.data.AUTOTUNE
+        )
+        return dataset, meta["count"]
+
+    def count_images(self, split: str) -> int:
+        """Number of images create_dataset yields for a split"""
+        if self.shard_dir:
+            count = self._read_shard_meta(split)["count"]
+        else:
+            count = len(self._list_images(split)[0])
+        return count // self.num_workers
+
+    def _worker_options(self) -> tf.data.Options:
+        # Each worker already reads only its share; tf.distribute must not
+        # shard it again
+        options = tf.data.Options()
+        options.experimental_distribute.auto_shard_policy = (
+            tf.data.experimental.AutoShardPolicy.OFF
+        )
+        return options
+
+    def create_dataset(
+        self,
+        split: str = "training",
+        cache_file: str = None,
+        augment: bool = None,
+        soft_targets: np.ndarray = None,
+    ) -> tf.data.Dataset:
+        """
+        Create dataset with enhanced error handling and logging, in two stages:
+
+        1. Decode, crop and resize to uint8, done once: from the pre-resized
+           shards when shard_dir is set, else from the original images and
+           cached in memory, or in cache_file when given.
+        2. Per epoch, on whole batches: scaling to [0, 1] and, for training,
+           random augmentation, so every epoch sees fresh augmentations.
+
+        A cache_file is reused while the split's file list is unchanged (see
+        cache_path); include img_size in its name. augment (shuffling and
+        augmenting) defaults to True for the training split only.
+
+        soft_targets, one row per image in the split's file order (e.g. a
+        teacher's predictions), are appended to each one-hot label, so the
+        labels of a batch are (batch, n_classes + soft_targets.shape[1]).
+        """
+        if augment is None:
+            augment = split == "training"
+
+        # With several workers, each takes every num_workers-th image, and all
+        # take the same number so that their epochs have the same steps
+        if self.shard_dir:
+            dataset, num_images = self._shard_dataset(split)
+            if self.num_workers > 1:
+                num_images //= self.num_workers
+                dataset = dataset.shard(self.num_workers, self.worker_index)
+                dataset = dataset.take(num_images)
+        else:
+            image_files, labels = self._list_images(split)
+            if self.num_workers > 1:
+                num_images = len(image_files) // self.num_workers
+                image_files = image_files[self.worker_index :: self.num_workers]
+                labels = labels[self.worker_index :: self.num_workers]
+                image_files, labels = image_files[:num_images], labels[:num_images]
+            num_images = len(image_files)
+
+            # Create TensorFlow dataset
+            dataset = tf.data.Dataset.from_tensor_slices(
+                (tf.constant(image_files), tf.constant(labels, dtype=tf.int32))
+            )
+            dataset = dataset.map(
+                lambda filename, label: (self._decode_and_resize(filename), label),
+                num_parallel_calls=tf.data.AUTOTUNE,
+            )
+            if cache_file:
+                os.makedirs(os.path.dirname(cache_file) or ".", exist_ok=True)
+                cache_file = self.cache_path(split, cache_file)
+                self._remove_stale_caches(cache_file)
+            dataset = dataset.cache(cache_file or "")
+
+        if soft_targets is not None:
+            if self.shard_dir or self.num_workers > 1:
+                raise ValueError("soft_targets need the full split in file order")
+            if len(soft_targets) != num_images:
+                raise ValueError(
+                    f"{len(soft_targets)} soft targets for {num_images} {split} images"
+                )
+            # Attached after the cache, which keeps the file order, so the
+            # cache stays the same with or without targets
+            targets = tf.data.Dataset.from_tensor_slices(
+                np.asarray(soft_targets, np.float32)
+            )
+            dataset = tf.data.Dataset.zip((dataset, targets)).map(
+                lambda example, target: (*example, target)
+            )
+
+        if augment:
+            # Shuffle training data with larger buffer, still as uint8
             dataset = dataset.shuffle(
-                buffer_size=min(50000, len(image_files)), reshuffle_each_iteration=True
+                buffer_size=min(50000, num_images), reshuffle_each_iteration=True
             )
 
+        dataset = dataset.batch(self.batch_size)
+        prepare_batch = self._augment_batch if augment else self._normalize_batch
+        if soft_targets is not None:
+            dataset = dataset.map(
+                lambda images, labels, targets: self._with_targets(
+                    *prepare_batch(images, labels), targets
+                ),
+                num_parallel_calls=tf.data.AUTOTUNE,
+            )
+        else:
+            dataset = dataset.map(prepare_batch, num_parallel_calls=tf.data.AUTOTUNE)
+
+        if self.num_workers > 1:
+            dataset = dataset.with_options(self._worker_options())
+
         # Optimize performance
-        dataset = dataset.batch(self.batch_size).prefetch(tf.data.AUTOTUNE).cache()
+        return dataset.prefetch(tf.data.AUTOTUNE)
 
-        return dataset
+    def create_sample(
+        self, split: str, num_images: int, seed: int = 0
+    ) -> tf.data.Dataset:
+        """
+        Batches of num_images images of a split drawn at random, about as
+        many from each class, scaled like create_dataset's. The same seed
+        gives the same sample; e.g. for calibration, where the split's
+        sorted file order would give almost only its first class.
+        """
+        image_files, labels, _ = self._split_files(split)
+        rng = np.random.RandomState(seed)
+        per_class = -(-num_images // len(self.categories))
+        chosen = np.concatenate(
+            [
+                rng.permutation(np.flatnonzero(labels == label))[:per_class]
+                for label in range(len(self.categories))
+            ]
+        )
+        chosen = rng.permutation(chosen)[:num_images]
+        if not len(chosen):
+            raise ValueError(f"No images found in {split}")
+
+        dataset = tf.data.Dataset.from_tensor_slices(
+            (tf.constant([image_files[i] for i in chosen]), labels[chosen])
+        )
+        return (
+            dataset.map(
+                lambda filename, label: (self._decode_and_resize(filename), label),
+                num_parallel_calls=tf.data.AUTOTUNE,
+            )
+            .batch(self.batch_size)
+            .map(self._normalize_batch, num_parallel_calls=tf.data.AUTOTUNE)
+            .prefetch(tf.data.AUTOTUNE)
+        )
 
     def get_class_weights(self, split: str = "training") -> Dict[int, float]:
         """
         Calculate balanced class weights with improved handling of edge cases
         """
-        split_dir = os.path.join(self.data_dir, split)
-
-        # Count images in each class
-        counts = {}
-        for i, category in enumerate(self.categories):
-            category_dir = os.path.join(split_dir, category)
-            if os.path.exists(category_dir):
-                counts[i] = len(
-                    [
-                        f
-                        for f in os.listdir(category_dir)
-                        if f.lower().endswith((".jpg", ".jpeg", ".png"))
-                    ]
-                )
-            else:
-                counts[i] = 0
-                print(f"Warning: Directory not found: {category_dir}")
+        if self.shard_dir:
+            # The shard metadata already has the counts
+            split_dir = os.path.join(self.shard_dir, split)
+            counts = np.array(self._read_shard_meta(split)["class_counts"])
+        else:
+            split_dir = os.path.join(self.data_dir, split)
+            counts = np.bincount(
+                self._split_files(split)[1], minlength=len(self.categories)
+            )
 
         # Calculate total samples
-        total_samples = sum(counts.values())
+        total_samples = counts.sum()
         if total_samples == 0:
             raise ValueError(f"No images found in {split_dir}")
 
-        # Calculate balanced weights
+        # Calculate balanced weights, 1.0 for classes without images
         n_classes = len(self.categories)
-        weights = {}
-        for class_idx, count in counts.items():
-            if count == 0:
-                weights[class_idx] = 1.0
-            else:
-                weights[class_idx] = total_samples / (n_classes * count)
+        balanced = total_samples / (n_classes * np.maximum(counts, 1))
+        weights = dict(enumerate(np.where(counts > 0, balanced, 1.0).tolist()))
 
         # Print weight distribution
         print(f"\nClass weights for {split}:")
@@ -174,41 +509,44 @@ class FoodDataset:
 
         return weights
 
-    def validate_dataset(self) -> None:
+    def validate_dataset(
+        self, workers: int = None, full_decode: bool = False, rescan: bool = None
+    ) -> None:
         """
-        Validate dataset integrity and balance
+        Validate dataset integrity in parallel. Results are kept in the index,
+        so only new or changed images are checked, and corrupted images are
+        left out of create_dataset.
+
+        rescan (by default with full_decode) first rescans every directory of
+        the index, which also finds files rewritten in place: those leave
+        their directory's mtime unchanged, so a normal refresh misses them.
         """
-        for split in ["training", "validation", "evaluation"]:
+        if rescan is None:
+            rescan = full_decode
+        if rescan:
+            scanned = self.index.refresh(full=True)
+            print(f"Rescanned {scanned} directories in {self.data_dir}")
+
+        rel_paths = self.index.to_validate(full_decode)
+        if rel_paths:
+            print(f"Checking {len(rel_paths)} new or changed images...")
+            paths = [os.path.join(self.data_dir, path) for path in rel_paths]
+            results = check_images(paths, workers, full_decode)
+            self.index.set_validation(dict(zip(rel_paths, results)))
+
+        for split in self.splits:
             split_dir = os.path.join(self.data_dir, split)
             if not os.path.exists(split_dir):
                 print(f"Warning: Split directory not found: {split_dir}")
                 continue
 
-            total_images = 0
-            corrupted_images = 0
-
-            for category in self.categories:
-                category_dir = os.path.join(split_dir, category)
-                if not os.path.exists(category_dir):
-                    print(f"Warning: Category directory not found: {category_dir}")
-                    continue
-
-                # Check each image
-                for img_name in os.listdir(category_dir):
-                    if not img_name.lower().endswith((".jpg", ".jpeg", ".png")):
-                        continue
-
-                    total_images += 1
-                    img_path = os.path.join(category_dir, img_name)
-
-                    try:
-                        with tf.io.gfile.GFile(img_path, "rb") as fid:
-                            image_data = fid.read()
-                            _ = tf.image.decode_jpeg(image_data, channels=3)
-                    except tf.errors.InvalidArgumentError:
-                        print(f"Corrupted image found: {img_path}")
-                        corrupted_images += 1
+            total_images, corrupted = self.index.validation(split)
+            for path, reason in corrupted:
+                print(
+                    f"Corrupted image found: {os.path.join(self.data_dir, path)} "
+                    f"({reason})"
+                )
 
             print(f"\nDataset validation results for {split}:")
             print(f"Total images: {total_images}")
-            print(f"Corrupted images: {corrupted_images}")
+            print(f"Corrupted images: {len(corrupted)}")
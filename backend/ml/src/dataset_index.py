@@ -0,0 +1,188 @@
+# dataset_index.py
+import os
+import sqlite3
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+INDEX_NAME = "index.sqlite"
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    path TEXT PRIMARY KEY,  -- relative to the dataset root
+    dir TEXT NOT NULL,
+    split TEXT NOT NULL,
+    label INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    valid INTEGER,  -- NULL until validated
+    detail TEXT,
+    method TEXT
+);
+CREATE INDEX IF NOT EXISTS images_split ON images (split, label);
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL
+);
+"""
+
+
+class DatasetIndex:
+    """
+    Persistent index of a split/category image tree in a sqlite file: path,
+    split, label, size, mtime and validation result per image.
+
+    refresh() rescans only the category directories whose mtime changed, so
+    after the first scan an unchanged tree costs one stat per directory.
+    Directory mtimes change when files are added, removed or renamed, not
+    when a file is rewritten in place; refresh(full=True) catches those
+    (FoodDataset.validate_dataset with rescan, validation.py --rescan).
+    """
+
+    def __init__(self, data_dir: str, categories: List[str], splits: List[str]):
+        self.data_dir = data_dir
+        self.categories = categories
+        self.splits = splits
+        # Several processes may open the index at once (training workers,
+        # sweep trials): writers wait for the lock instead of failing, and
+        # with WAL readers do not block on them
+        self.connection = sqlite3.connect(
+            os.path.join(data_dir, INDEX_NAME), timeout=60
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+
+    def refresh(self, full: bool = False) -> int:
+        """Bring the index up to date; returns the number of directories scanned"""
+        known = dict(self.connection.execute("SELECT path, mtime_ns FROM dirs"))
+        scanned = 0
+
+        for split in self.splits:
+            for label, category in enumerate(self.categories):
+                rel_dir = os.path.join(split, category)
+                try:
+                    mtime_ns = os.stat(os.path.join(self.data_dir, rel_dir)).st_mtime_ns
+                except FileNotFoundError:
+                    print(f"Warning: Directory not found: {rel_dir}")
+                    with self.connection:
+                        self.connection.execute(
+                            "DELETE FROM images WHERE dir = ?", (rel_dir,)
+                        )
+                        self.connection.execute(
+                            "DELETE FROM dirs WHERE path = ?", (rel_dir,)
+                        )
+                    continue
+
+                if not full and known.get(rel_dir) == mtime_ns:
+                    continue
+                # One transaction per directory, so the write lock is never
+                # held for the whole scan
+                with self.connection:
+                    self._scan(rel_dir, split, label)
+                    self.connection.execute(
+                        "INSERT OR REPLACE INTO dirs VALUES (?, ?)", (rel_dir, mtime_ns)
+                    )
+                scanned += 1
+
+        return scanned
+
+    def _scan(self, rel_dir: str, split: str, label: int):
+        """Replace one directory's rows, keeping validation of unchanged files"""
+        previous = {
+            path: (size, mtime, valid, detail, method)
+            for path, size, mtime, valid, detail, method in self.connection.execute(
+                "SELECT path, size, mtime, valid, detail, method FROM images "
+                "WHERE dir = ?",
+                (rel_dir,),
+            )
+        }
+
+        rows = []
+        with os.scandir(os.path.join(self.data_dir, rel_dir)) as entries:
+            for entry in entries:
+                if not entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                path = os.path.join(rel_dir, entry.name)
+                validation = (None, None, None)
+                old = previous.get(path)
+                if old is not None and old[:2] == (stat.st_size, stat.st_mtime):
+                    validation = old[2:]
+                rows.append(
+                    (path, rel_dir, split, label, stat.st_size, stat.st_mtime)
+                    + validation
+                )
+
+        self.connection.execute("DELETE FROM images WHERE dir = ?", (rel_dir,))
+        self.connection.executemany(
+            "INSERT INTO images VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+        )
+
+    def files(self, split: str) -> Tuple[List[str], np.ndarray]:
+        """
+        Relative paths and labels of a split's images, sorted by path,
+        leaving out images validated as corrupted
+        """
+        rows = self.connection.execute(
+            "SELECT path, label FROM images "
+            "WHERE split = ? AND (valid IS NULL OR valid = 1) ORDER BY path",
+            (split,),
+        ).fetchall()
+        paths = [path for path, _ in rows]
+        labels = np.fromiter((label for _, label in rows), np.int32, len(rows))
+        return paths, labels
+
+    def stats(self, split: str) -> Dict[str, Tuple[int, float]]:
+        """(size, mtime) of every indexed image of a split, by relative path"""
+        return {
+            path: (size, mtime)
+            for path, size, mtime in self.connection.execute(
+                "SELECT path, size, mtime FROM images WHERE split = ?", (split,)
+            )
+        }
+
+    def class_counts(self, split: str) -> np.ndarray:
+        """Usable images per label for a split"""
+        return np.bincount(self.files(split)[1], minlength=len(self.categories))
+
+    def to_validate(self, full_decode: bool = False) -> List[str]:
+        """Images never validated, or only header-checked when full_decode"""
+        condition = "valid IS NULL"
+        if full_decode:
+            condition += " OR method != 'decode'"
+        return [
+            path
+            for (path,) in self.connection.execute(
+                f"SELECT path FROM images WHERE {condition} ORDER BY path"
+            )
+        ]
+
+    def set_validation(self, results: Dict[str, Tuple[bool, str, str]]):
+        """Store (valid, detail, method) results by relative path"""
+        with self.connection:
+            self.connection.executemany(
+                "UPDATE images SET valid = ?, detail = ?, method = ? WHERE path = ?",
+                [
+                    (int(valid), detail, method, path)
+                    for path, (valid, detail, method) in results.items()
+                ],
+            )
+
+    def validation(self, split: str) -> Tuple[int, List[Tuple[str, str]]]:
+        """Number of images in a split and its (path, reason) corrupted images"""
+        (total,) = self.connection.execute(
+            "SELECT COUNT(*) FROM images WHERE split = ?", (split,)
+        ).fetchone()
+        corrupted = self.connection.execute(
+            "SELECT path, detail FROM images WHERE split = ? AND valid = 0 "
+            "ORDER BY path",
+            (split,),
+        ).fetchall()
+        return total, corrupted
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,156 @@
+# distillation.py
+"""
+Knowledge distillation: a small student learns from the trained model (the
+teacher) as well as from the labels.
+
+The teacher's log-probabilities are computed once per split and stored as
+.npy files in the split's file order, then handed to
+FoodDataset.create_dataset as soft targets, so every batch carries
+[one-hot label, teacher log-probabilities] and the teacher never runs during
+training. At any temperature T, softmax(log p / T) is the teacher's
+distribution softened exactly as softmax(logits / T) would be.
+
+Layout of a teacher directory:
+    {split}_log_probs.npy  float32 (N, n_classes)
+    {split}_meta.json      teacher file, image size, count and file list
+                           fingerprint, written last
+"""
+import json
+import os
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import layers, models
+
+from dataset import FoodDataset
+
+
+def teacher_paths(teacher_dir: str, split: str):
+    return tuple(
+        os.path.join(teacher_dir, f"{split}_{name}")
+        for name in ("log_probs.npy", "meta.json")
+    )
+
+
+def teacher_log_probs(
+    teacher,
+    teacher_path: str,
+    dataset: FoodDataset,
+    teacher_dir: str,
+    split: str,
+    cache_file: str = None,
+):
+    """
+    Run the teacher once over a split, in file order, and store its
+    log-probabilities. Stored ones are reused while the teacher file and the
+    split are unchanged.
+    """
+    if dataset.shard_dir:
+        raise ValueError("Teacher targets are aligned with the files, not shards")
+
+    log_probs_path, meta_path = teacher_paths(teacher_dir, split)
+    stat = os.stat(teacher_path)
+    meta = {
+        "teacher": os.path.abspath(teacher_path),
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "img_size": list(dataset.img_size),
+        "count": dataset.count_images(split),
+        # Targets are matched to images by position, so any change to the
+        # file list makes them stale even at the same count
+        "files": dataset.fingerprint(split),
+    }
+
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            if json.load(f) == meta:
+                print(f"Using stored {split} teacher targets from {teacher_dir}")
+                return np.load(log_probs_path)
+
+    os.makedirs(teacher_dir, exist_ok=True)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)  # Stale until the new targets are complete
+
+    print(f"\nRunning the teacher over {meta['count']} {split} images...")
+    batches = [
+        teacher.predict_on_batch(images)
+        for images, _ in dataset.create_dataset(split, cache_file, augment=False)
+    ]
+    # Clipped so a saturated softmax does not give -inf
+    probs = np.clip(np.concatenate(batches), 1e-7, 1.0)
+    log_probs = np.log(probs).astype(np.float32)
+    if len(log_probs) != meta["count"]:
+        raise ValueError(
+            f"Expected {meta['count']} {split} images, got {len(log_probs)}"
+        )
+
+    np.save(log_probs_path, log_probs)
+    with open(meta_path, "w") as f:
+        json.dump(meta, f, indent=2)
+    return log_probs
+
+
+class DistillationLoss(tf.keras.losses.Loss):
+    """
+    (1 - soft_weight) * cross-entropy with the labels
+    + soft_weight * T^2 * KL(teacher || student), both softened by T.
+
+    y_true is [one-hot labels, teacher log-probabilities] and y_pred the
+    student's logits. The T^2 keeps the soft term's gradients on the scale
+    of the hard term's as T changes.
+    """
+
+    def __init__(self, n_classes=3, temperature=4.0, soft_weight=0.9, **kwargs):
+        super().__init__(**kwargs)
+        self.n_classes = n_classes
+        self.temperature = temperature
+        self.soft_weight = soft_weight
+
+    def call(self, y_true, y_pred):
+        labels, teacher = y_true[:, : self.n_classes], y_true[:, self.n_classes :]
+        hard = tf.keras.losses.categorical_crossentropy(
+            labels, y_pred, from_logits=True
+        )
+
+        teacher = tf.nn.log_softmax(teacher / self.temperature)
+        student = tf.nn.log_softmax(y_pred / self.temperature)
+        soft = tf.reduce_sum(tf.exp(teacher) * (teacher - student), axis=-1)
+
+        return (1 - self.soft_weight) * hard + (
+            self.soft_weight * self.temperature**2 * soft
+        )
+
+    def get_config(self):
+        return {
+            **super().get_config(),
+            "n_classes": self.n_classes,
+            "temperature": self.temperature,
+            "soft_weight": self.soft_weight,
+        }
+
+
+def label_accuracy(n_classes=3):
+    """Accuracy against the labels part of the distillation targets"""
+
+    def accuracy(y_true, y_pred):
+        return tf.keras.metrics.categorical_accuracy(y_true[:, :n_classes], y_pred)
+
+    # Logged as accuracy/val_accuracy like the other modes, for the callbacks
+    return tf.keras.metrics.MeanMetricWrapper(accuracy, name="accuracy")
+
+
+def with_softmax(student):
+    """
+    The trained student as a drop-in classifier: its layers followed by a
+    float32 softmax, compiled like the other models
+    """
+    model = models.Sequential(
+        [*student.layers, layers.Activation("softmax", dtype="float32")]
+    )
+    model.build((None, *student.input_shape[1:]))
+    model.compile(
+        optimizer="adam",
+        loss="categorical_crossentropy",
+        metrics=["accuracy"],
+    )
+    return model
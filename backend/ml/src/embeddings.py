@@ -0,0 +1,143 @@
+# embeddings.py
+"""
+Frozen-backbone training: the MobileNetV2 features of every image are
+computed once per split and stored as memory-mapped .npy files, so the
+classification head trains on 1280-d vectors instead of re-running the
+backbone on 224x224 images every epoch.
+
+Layout of a feature directory:
+    {split}_features.npy  float32 (N, feature_dim)
+    {split}_labels.npy    int32 (N,)
+    {split}_meta.json     backbone name, image size, compute dtype, count and
+                          file list fingerprint, written last
+"""
+import json
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from dataset import FoodDataset
+
+
+def feature_paths(feature_dir: str, split: str):
+    return tuple(
+        os.path.join(feature_dir, f"{split}_{name}")
+        for name in ("features.npy", "labels.npy", "meta.json")
+    )
+
+
+def extract_features(
+    dataset: FoodDataset,
+    feature_extractor,
+    feature_dir: str,
+    split: str,
+    cache_file: str = None,
+    recompute: bool = False,
+):
+    """
+    Run the backbone once over a split and store its features and labels.
+    Features already stored for the same backbone, image size, compute dtype
+    and file list are reused.
+
+    Returns:
+        (features, labels), with features memory-mapped read-only
+    """
+    features_path, labels_path, meta_path = feature_paths(feature_dir, split)
+    meta = {
+        # Keras names the backbone after its width and input size
+        "backbone": feature_extractor.layers[0].name,
+        "img_size": list(dataset.img_size),
+        # float16 under mixed precision; stored as float32 either way, but
+        # rounded differently, so a float32 run does not reuse them
+        "dtype": feature_extractor.layers[0].compute_dtype,
+        "count": dataset.count_images(split),
+        # Changes with the file list even when the count stays the same
+        "files": dataset.fingerprint(split),
+    }
+
+    if not recompute and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            if json.load(f) == meta:
+                print(f"Using stored {split} features from {feature_dir}")
+                return np.load(features_path, mmap_mode="r"), np.load(labels_path)
+
+    os.makedirs(feature_dir, exist_ok=True)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)  # Stale until the new features are complete
+
+    count = meta["count"]
+    feature_dim = feature_extractor.output_shape[-1]
+    features = np.lib.format.open_memmap(
+        features_path, mode="w+", dtype=np.float32, shape=(count, feature_dim)
+    )
+    labels = np.empty(count, dtype=np.int32)
+
+    print(f"\nExtracting {split} features for {count} images...")
+    offset = 0
+    for images, one_hot in dataset.create_dataset(split, cache_file, augment=False):
+        batch = feature_extractor(images, training=False).numpy()
+        features[offset : offset + len(batch)] = batch
+        labels[offset : offset + len(batch)] = np.argmax(one_hot, axis=1)
+        offset += len(batch)
+
+    if offset != count:
+        raise ValueError(f"Expected {count} {split} images, got {offset}")
+
+    features.flush()
+    del features
+    np.save(labels_path, labels)
+    with open(meta_path, "w") as f:
+        json.dump(meta, f, indent=2)
+
+    return np.load(features_path, mmap_mode="r"), labels
+
+
+def class_weights_from_labels(labels: np.ndarray, n_classes: int = 3):
+    """Balanced class weights, 1.0 for classes without samples"""
+    counts = np.bincount(labels, minlength=n_classes)
+    weights = np.where(
+        counts > 0, len(labels) / (n_classes * np.maximum(counts, 1)), 1.0
+    )
+    return dict(enumerate(weights.tolist()))
+
+
+def train_head(
+    head,
+    train_features,
+    train_labels,
+    val_features,
+    val_labels,
+    epochs: int = 50,
+    batch_size: int = 256,
+    callbacks=(),
+):
+    """Fit a compiled head on stored features, keeping its best epoch"""
+    n_classes = head.output_shape[-1]
+    class_weights = class_weights_from_labels(train_labels, n_classes)
+    print("\nClass weights:", class_weights)
+
+    callbacks = [
+        tf.keras.callbacks.EarlyStopping(
+            monitor="val_accuracy", patience=5, restore_best_weights=True
+        ),
+        tf.keras.callbacks.ReduceLROnPlateau(
+            monitor="val_loss", factor=0.2, patience=3, min_lr=1e-6
+        ),
+        *callbacks,
+    ]
+
+    return head.fit(
+        train_features,
+        np.eye(n_classes, dtype=np.float32)[train_labels],
+        validation_data=(
+            val_features,
+            np.eye(n_classes, dtype=np.float32)[val_labels],
+        ),
+        epochs=epochs,
+        batch_size=batch_size,
+        shuffle=True,
+        callbacks=callbacks,
+        class_weight=class_weights,
+        verbose=1,
+    )
@@ -0,0 +1,170 @@
+# evaluate.py
+"""
+Evaluate a model on the whole evaluation split, streamed through the
+batched, prefetched FoodDataset pipeline and run by the serving backends,
+so .h5 and .tflite files are measured the same way.
+
+Reports accuracy, per-class precision and recall, the confusion matrix,
+expected calibration error (ECE), and images per second, both end to end and
+for inference alone. --output writes the report as JSON, to diff between
+model versions; --baseline prints the differences from an earlier report.
+
+Usage: python evaluate.py [--model ../model/model_latest.tflite]
+           [--output report.json] [--baseline previous.json]
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+DATA_DIR = "../data/hybrid_dataset"
+MODEL_PATH = "../model/model_latest.h5"
+
+
+def calibration_error(confidences, correct, num_bins=15):
+    """
+    Expected calibration error: the gap between top-1 confidence and
+    accuracy, averaged over equal-width confidence bins weighted by size
+    """
+    bins = np.minimum((confidences * num_bins).astype(int), num_bins - 1)
+    error = 0.0
+    for index in range(num_bins):
+        in_bin = bins == index
+        if in_bin.any():
+            gap = abs(confidences[in_bin].mean() - correct[in_bin].mean())
+            error += in_bin.mean() * gap
+    return float(error)
+
+
+def summarize(labels, probabilities, categories):
+    """Accuracy, per-class metrics, confusion matrix and calibration"""
+    predicted = np.argmax(probabilities, axis=1)
+    confidences = probabilities[np.arange(len(predicted)), predicted]
+    correct = predicted == labels
+
+    n_classes = len(categories)
+    # Rows are the true classes, columns the predicted ones
+    confusion = np.zeros((n_classes, n_classes), dtype=np.int64)
+    np.add.at(confusion, (labels, predicted), 1)
+
+    per_class = {}
+    for index, category in enumerate(categories):
+        true_positives = confusion[index, index]
+        predicted_count = confusion[:, index].sum()
+        support = confusion[index].sum()
+        per_class[category] = {
+            "precision": float(true_positives / predicted_count)
+            if predicted_count
+            else 0.0,
+            "recall": float(true_positives / support) if support else 0.0,
+            "support": int(support),
+        }
+
+    return {
+        "accuracy": float(correct.mean()),
+        "per_class": per_class,
+        "confusion_matrix": confusion.tolist(),
+        "ece": calibration_error(confidences, correct),
+        "mean_confidence": float(confidences.mean()),
+    }
+
+
+def evaluate(model_path, backend_name=None, batch_size=32, num_threads=None):
+    from backends import create_backend
+    from dataset import FoodDataset
+
+    if backend_name is None:
+        backend_name = "tflite" if model_path.endswith(".tflite") else "keras"
+    backend = create_backend(
+        backend_name, model_path, num_threads=num_threads, warmup=(batch_size,)
+    )
+    dataset = FoodDataset(DATA_DIR, backend.input_size, batch_size)
+
+    labels, probabilities = [], []
+    inference_seconds = 0.0
+    start = time.perf_counter()
+    for images, one_hot in dataset.create_dataset("evaluation", augment=False):
+        images = images.numpy()
+        batch_start = time.perf_counter()
+        probabilities.append(backend.predict(images))
+        inference_seconds += time.perf_counter() - batch_start
+        labels.append(np.argmax(one_hot, axis=1))
+    total_seconds = time.perf_counter() - start
+
+    labels, probabilities = np.concatenate(labels), np.concatenate(probabilities)
+    report = {
+        "model": os.path.abspath(model_path),
+        "backend": backend_name,
+        "model_mb": os.path.getsize(model_path) / (1024 * 1024),
+        "input_size": list(backend.input_size),
+        "batch_size": batch_size,
+        "num_images": len(labels),
+        **summarize(labels, probabilities, dataset.categories),
+        "images_per_sec": len(labels) / total_seconds,
+        "inference_images_per_sec": len(labels) / inference_seconds,
+    }
+    return report
+
+
+def print_report(report, baseline=None):
+    print(f"\nModel: {report['model']} ({report['backend']})")
+    print(f"Images: {report['num_images']}")
+    print("-" * 50)
+
+    def line(name, key, fmt):
+        value = f"{name:<28}{report[key]:{fmt}}"
+        if baseline is not None and key in baseline:
+            value += f"  ({report[key] - baseline[key]:+{fmt}})"
+        print(value)
+
+    line("Accuracy", "accuracy", ".4f")
+    line("ECE", "ece", ".4f")
+    line("Images/sec (end to end)", "images_per_sec", ".1f")
+    line("Images/sec (inference)", "inference_images_per_sec", ".1f")
+
+    categories = list(report["per_class"])
+    print(f"\n{'':<16}{'precision':>10}{'recall':>10}{'support':>10}")
+    for category, metrics in report["per_class"].items():
+        print(
+            f"{category:<16}{metrics['precision']:>10.4f}"
+            f"{metrics['recall']:>10.4f}{metrics['support']:>10d}"
+        )
+
+    print("\nConfusion matrix (rows: true, columns: predicted):")
+    print(" " * 16 + "".join(f"{category[:14]:>16}" for category in categories))
+    for category, row in zip(categories, report["confusion_matrix"]):
+        print(f"{category:<16}" + "".join(f"{count:>16d}" for count in row))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate a model")
+    parser.add_argument("--model", default=MODEL_PATH, help=".h5 or .tflite file")
+    parser.add_argument(
+        "--backend",
+        choices=["keras", "tflite"],
+        help="Default: from the model file's extension",
+    )
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--num-threads", type=int)
+    parser.add_argument("--output", help="Write the report to this JSON file")
+    parser.add_argument("--baseline", help="Earlier JSON report to compare with")
+    args = parser.parse_args()
+
+    report = evaluate(args.model, args.backend, args.batch_size, args.num_threads)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"\nReport written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
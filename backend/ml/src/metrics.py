@@ -0,0 +1,169 @@
+# metrics.py
+import bisect
+import os
+import threading
+import time
+
+# Geometric buckets from 0.1 ms to about 40 s, each 1.5x the last, which keeps
+# quantile estimates within roughly 25% at the cost of one bisect per sample
+BUCKETS = tuple(0.0001 * 1.5**i for i in range(32))
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class StageTimer:
+    """
+    Per-request stage timings on the monotonic clock. mark(stage) charges the
+    time since the previous mark to stage, so timing a request costs one
+    perf_counter call per stage.
+    """
+
+    __slots__ = ("start", "last", "timings")
+
+    def __init__(self):
+        self.start = self.last = time.perf_counter()
+        self.timings = {}
+
+    def mark(self, stage: str):
+        now = time.perf_counter()
+        self.timings[stage] = self.timings.get(stage, 0.0) + now - self.last
+        self.last = now
+
+    def total(self) -> float:
+        return self.last - self.start
+
+    def as_ms(self) -> dict:
+        timings = {stage: seconds * 1000 for stage, seconds in self.timings.items()}
+        timings["total"] = self.total() * 1000
+        return timings
+
+
+class LatencyHistogram:
+    """Cumulative latency histogram with fixed buckets, in seconds"""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by interpolating inside its bucket"""
+        if not self.count:
+            return 0.0
+
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                if index == len(self.buckets):
+                    return lower  # Beyond the last bucket; best lower bound
+                upper = self.buckets[index]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+class StageMetrics:
+    """Latency histograms per request stage, exportable as Prometheus text"""
+
+    def __init__(self, name: str = "tamalife_inference_stage_seconds"):
+        self.name = name
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def _observe(self, stage: str, seconds: float):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = LatencyHistogram()
+        histogram.observe(seconds)
+
+    def observe(self, stage: str, seconds: float):
+        with self.lock:
+            self._observe(stage, seconds)
+
+    def observe_timer(self, timer: StageTimer):
+        """Record every stage of a finished request, plus its total"""
+        with self.lock:
+            for stage, seconds in timer.timings.items():
+                self._observe(stage, seconds)
+            self._observe("total", timer.total())
+
+    def summary(self) -> dict:
+        """Counts and p50/p95/p99 per stage, in milliseconds"""
+        summary = {}
+        with self.lock:
+            for stage, histogram in sorted(self.histograms.items()):
+                stats = {"count": histogram.count}
+                for q in QUANTILES:
+                    stats[f"p{round(q * 100)}_ms"] = histogram.quantile(q) * 1000
+                summary[stage] = stats
+        return summary
+
+    def prometheus_text(self) -> str:
+        """Render the histograms in the Prometheus text exposition format"""
+        lines = [
+            f"# HELP {self.name} Time spent in each stage of a classification",
+            f"# TYPE {self.name} histogram",
+        ]
+        quantile_lines = [
+            f"# HELP {self.name}_quantile Estimated latency quantiles per stage",
+            f"# TYPE {self.name}_quantile gauge",
+        ]
+
+        with self.lock:
+            for stage, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for upper, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(
+                        f'{self.name}_bucket{{stage="{stage}",le="{upper:.6g}"}} '
+                        f"{cumulative}"
+                    )
+                lines.append(
+                    f'{self.name}_bucket{{stage="{stage}",le="+Inf"}} '
+                    f"{histogram.count}"
+                )
+                lines.append(f'{self.name}_sum{{stage="{stage}"}} {histogram.sum}')
+                lines.append(f'{self.name}_count{{stage="{stage}"}} {histogram.count}')
+                for q in QUANTILES:
+                    quantile_lines.append(
+                        f'{self.name}_quantile{{stage="{stage}",quantile="{q}"}} '
+                        f"{histogram.quantile(q)}"
+                    )
+
+        return "\n".join(lines + quantile_lines) + "\n"
+
+    def write(self, path: str):
+        """Atomically write the Prometheus text, e.g. for a textfile collector"""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+
+class MetricsExporter:
+    """Rewrites a metrics file every interval seconds until stopped"""
+
+    def __init__(self, metrics: StageMetrics, path: str, interval: float = 10.0):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.metrics.write(self.path)
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.metrics.write(self.path)
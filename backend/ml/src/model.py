@@ -18,7 +18,8 @@ def create_model(input_shape=(224, 224, 3)):
             layers.GlobalAveragePooling2D(),
             layers.Dense(128, activation="relu"),
             layers.Dropout(0.2),
-            layers.Dense(3, activation="softmax"),  # Changed to 3 outputs with softmax
+            # Changed to 3 outputs with softmax
+            layers.Dense(3, activation="softmax", dtype="float32"),
         ]
     )
 
@@ -32,33 +33,94 @@ def create_model(input_shape=(224, 224, 3)):
     return model
 
 
-def create_model_with_fine_tuning(input_shape=(224, 224, 3), fine_tune_layers=30):
+def create_model_with_fine_tuning(
+    input_shape=(224, 224, 3),
+    fine_tune_layers=30,
+    dense_units=(256, 128),
+    dropout=(0.3, 0.2),
+    learning_rate=1e-4,
+):
+    """
+    MobileNetV2 with its top fine_tune_layers trainable (0 freezes it all).
+    dropout is one rate per dense layer, or a single rate for all of them.
+    """
     # Base model (MobileNetV2)
     base_model = tf.keras.applications.MobileNetV2(
         input_shape=input_shape, include_top=False, weights="imagenet"
     )
 
     # Freeze early layers
-    base_model.trainable = True
-    for layer in base_model.layers[:-fine_tune_layers]:
+    base_model.trainable = fine_tune_layers > 0
+    for layer in base_model.layers[:-fine_tune_layers] if fine_tune_layers else []:
         layer.trainable = False
 
+    if isinstance(dropout, (int, float)):
+        dropout = [dropout] * len(dense_units)
+
     # Create new model with 3 output classes
-    model = models.Sequential(
-        [
-            base_model,
-            layers.GlobalAveragePooling2D(),
-            layers.Dense(256, activation="relu"),
-            layers.Dropout(0.3),
-            layers.Dense(128, activation="relu"),
-            layers.Dropout(0.2),
-            layers.Dense(3, activation="softmax"),  # Three categories
-        ]
-    )
+    model = models.Sequential([base_model, layers.GlobalAveragePooling2D()])
+    for units, rate in zip(dense_units, dropout):
+        model.add(layers.Dense(units, activation="relu"))
+        model.add(layers.Dropout(rate))
+    # Three categories
+    model.add(layers.Dense(3, activation="softmax", dtype="float32"))
 
     # Compile with a lower learning rate for fine-tuning
     model.compile(
-        optimizer=tf.keras.optimizers.Adam(learning_rate=1e-4),
+        optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate),
+        loss="categorical_crossentropy",
+        metrics=["accuracy"],
+    )
+
+    return model
+
+
+def create_feature_extractor(input_shape=(224, 224, 3), alpha=1.0):
+    """
+    Frozen MobileNetV2 backbone plus global average pooling: images in,
+    pooled features (1280-d) out. Used to precompute embeddings once.
+    """
+    base_model = tf.keras.applications.MobileNetV2(
+        input_shape=input_shape, include_top=False, weights="imagenet", alpha=alpha
+    )
+    base_model.trainable = False
+
+    return models.Sequential([base_model, layers.GlobalAveragePooling2D()])
+
+
+def create_head(feature_dim=1280, hidden_units=(128,), dropout=0.2, learning_rate=1e-3):
+    """
+    Classification head trained on precomputed features: Dense/Dropout pairs
+    followed by the 3-way softmax
+    """
+    head = models.Sequential([tf.keras.Input(shape=(feature_dim,))])
+    for units in hidden_units:
+        head.add(layers.Dense(units, activation="relu"))
+        head.add(layers.Dropout(dropout))
+    # Output layers are float32 everywhere so that under a mixed-precision
+    # policy the softmax and the loss are still computed in float32
+    head.add(layers.Dense(3, activation="softmax", dtype="float32"))
+
+    head.compile(
+        optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate),
+        loss="categorical_crossentropy",
+        metrics=["accuracy"],
+    )
+
+    return head
+
+
+def assemble_model(feature_extractor, head):
+    """
+    Join a feature extractor and a trained head into one image classifier,
+    laid out like create_model (backbone, pooling, head layers)
+    """
+    model = models.Sequential(
+        [*feature_extractor.layers, *head.layers],
+    )
+    model.build((None, *feature_extractor.input_shape[1:]))
+    model.compile(
+        optimizer="adam",
         loss="categorical_crossentropy",
         metrics=["accuracy"],
     )
@@ -66,6 +128,49 @@ def create_model_with_fine_tuning(input_shape=(224, 224, 3), fine_tune_layers=30
     return model
 
 
+def create_student(input_shape=(128, 128, 3), architecture="mobilenet", alpha=0.35):
+    """
+    Small classifier for distillation, returning logits (no softmax) so the
+    loss can soften them with a temperature. Left uncompiled.
+
+    architecture "mobilenet" is a whole, trainable MobileNetV2 at width
+    alpha; "cnn" a plain stack of strided and separable convolutions.
+    """
+    if architecture == "mobilenet":
+        model = models.Sequential(
+            [
+                tf.keras.applications.MobileNetV2(
+                    input_shape=input_shape,
+                    include_top=False,
+                    weights="imagenet",
+                    alpha=alpha,
+                ),
+                layers.GlobalAveragePooling2D(),
+            ]
+        )
+    elif architecture == "cnn":
+        model = models.Sequential([tf.keras.Input(shape=input_shape)])
+        for index, filters in enumerate((32, 64, 128, 256)):
+            model.add(
+                layers.Conv2D(filters, 3, strides=2, padding="same", use_bias=False)
+            )
+            model.add(layers.BatchNormalization())
+            model.add(layers.ReLU())
+            if index:
+                model.add(
+                    layers.SeparableConv2D(filters, 3, padding="same", use_bias=False)
+                )
+                model.add(layers.BatchNormalization())
+                model.add(layers.ReLU())
+        model.add(layers.GlobalAveragePooling2D())
+    else:
+        raise ValueError(f"Unknown student architecture: {architecture}")
+
+    model.add(layers.Dropout(0.2))
+    model.add(layers.Dense(3, dtype="float32"))  # Logits of the three categories
+    return model
+
+
 def get_model_summary(model):
     """Get model architecture summary"""
     trainable_params = tf.keras.backend.count_params(
@@ -1,7 +1,13 @@
 # organize_dataset.py
+import argparse
+import errno
+import hashlib
+import json
 import os
+import queue
 import shutil
-from pathlib import Path
+import sys
+import threading
 
 # Define healthy and unhealthy categories from Food-101 Data Set
 HEALTHY_FOODS = [
@@ -75,110 +81,270 @@ UNHEALTHY_FOODS = [
 ]
 
 
-def create_hybrid_dataset():
-    # Define paths and output to our hybrid_dataset (combination of the two)
-    food101_path = "../data/food-101/images"
-    food5k_path = "../data/Food-5k"
-    output_path = "../data/hybrid_dataset"
+SPLITS = ["training", "validation", "evaluation"]
 
-    # Create directory structure
-    for split in ["training", "validation", "evaluation"]:
-        os.makedirs(os.path.join(output_path, split, "healthy_food"), exist_ok=True)
-        os.makedirs(os.path.join(output_path, split, "non_food"), exist_ok=True)
-        os.makedirs(os.path.join(output_path, split, "unhealthy_food"), exist_ok=True)
+# Fractions of each Food-101 category going to training and validation; the
+# rest is evaluation. Food-5K comes with its own splits, which are kept.
+TRAIN_FRACTION = 0.7
+VALIDATION_FRACTION = 0.15
 
-    # Copy non-food images from Food-5K
-    for split in ["training", "validation", "evaluation"]:
-        src_dir = os.path.join(food5k_path, split, "non_food")
-        dst_dir = os.path.join(output_path, split, "non_food")
+MANIFEST_NAME = "manifest.json"
 
-        print(f"Copying non-food images from {split} set...")
-        for img in os.listdir(src_dir):
-            if img.endswith(".jpg"):
-                shutil.copy2(os.path.join(src_dir, img), os.path.join(dst_dir, img))
+# ioctl request number of FICLONE (Linux), which shares a file's extents
+FICLONE = 0x40049409
+
+
+def assign_split(key):
+    """
+    Deterministic split for a file, from a hash of its name rather than its
+    position in a directory listing, so it never moves between runs
+    """
+    digest = hashlib.sha1(key.encode("utf-8")).digest()
+    position = int.from_bytes(digest[:8], "big") / 2**64
+    if position < TRAIN_FRACTION:
+        return "training"
+    if position < TRAIN_FRACTION + VALIDATION_FRACTION:
+        return "validation"
+    return "evaluation"
+
+
+def file_hash(path):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def reflink(src, dst):
+    """Copy-on-write clone of src; raises OSError where unsupported"""
+    import fcntl
+
+    with open(src, "rb") as source, open(dst, "wb") as target:
+        fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
 
-    # Copy and categorize food images from Food-101
-    total_images_per_category = 1000  # Adjust this number as needed
 
-    print("\nCopying healthy food images from Food-101...")
-    for category in HEALTHY_FOODS:
-        category_path = os.path.join(food101_path, category)
-        if not os.path.exists(category_path):
-            print(f"Warning: Category {category} not found")
+def place_file(src, dst, mode):
+    """
+    Put src at dst by copying, hardlinking or reflinking, replacing dst
+    atomically. Links fall back to a copy where the filesystem cannot link.
+    """
+    tmp = f"{dst}.tmp"
+    if os.path.lexists(tmp):
+        os.remove(tmp)
+
+    try:
+        if mode == "hardlink":
+            os.link(src, tmp)
+        elif mode == "reflink":
+            reflink(src, tmp)
+        else:
+            shutil.copy2(src, tmp)
+    except OSError as e:
+        if mode == "copy" or e.errno not in (
+            errno.EXDEV,
+            errno.EPERM,
+            errno.EOPNOTSUPP,
+            errno.ENOTTY,
+            errno.EINVAL,
+        ):
+            raise
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        shutil.copy2(src, tmp)
+
+    os.replace(tmp, dst)
+
+
+def plan_files(food101_path, food5k_path, images_per_category=1000):
+    """
+    Every file of the hybrid dataset as {relative destination: (source, split)}
+    """
+    plan = {}
+
+    # Non-food images from Food-5K, in its own splits
+    for split in SPLITS:
+        src_dir = os.path.join(food5k_path, split, "non_food")
+        if not os.path.exists(src_dir):
+            print(f"Warning: Directory not found: {src_dir}")
             continue
+        for img in sorted(os.listdir(src_dir)):
+            if img.endswith(".jpg"):
+                plan[os.path.join(split, "non_food", img)] = (
+                    os.path.join(src_dir, img),
+                    split,
+                )
+
+    # Food images from Food-101, split by hash
+    for label, categories in (
+        ("healthy_food", HEALTHY_FOODS),
+        ("unhealthy_food", UNHEALTHY_FOODS),
+    ):
+        for category in categories:
+            category_path = os.path.join(food101_path, category)
+            if not os.path.exists(category_path):
+                print(f"Warning: Category {category} not found")
+                continue
 
-        images = [f for f in os.listdir(category_path) if f.endswith(".jpg")]
-        images = images[:total_images_per_category]
-
-        # Calculate split sizes
-        num_images = len(images)
-        train_size = int(num_images * 0.7)
-        val_size = int(num_images * 0.15)
-
-        # Split images
-        train_images = images[:train_size]
-        val_images = images[train_size : train_size + val_size]
-        test_images = images[train_size + val_size :]
-
-        # Copy to respective splits in healthy_food directory
-        for split_info in [
-            ("training", train_images),
-            ("validation", val_images),
-            ("evaluation", test_images),
-        ]:
-            split_name, split_images = split_info
-            for img in split_images:
-                shutil.copy2(
+            images = sorted(f for f in os.listdir(category_path) if f.endswith(".jpg"))
+            for img in images[:images_per_category]:
+                split = assign_split(f"{category}/{img}")
+                plan[os.path.join(split, label, f"{category}_{img}")] = (
                     os.path.join(category_path, img),
-                    os.path.join(
-                        output_path, split_name, "healthy_food", f"{category}_{img}"
-                    ),
+                    split,
                 )
 
-    print("\nCopying unhealthy food images from Food-101...")
-    for category in UNHEALTHY_FOODS:
-        # Same process for unhealthy foods
-        category_path = os.path.join(food101_path, category)
-        if not os.path.exists(category_path):
-            print(f"Warning: Category {category} not found")
+    return plan
+
+
+def load_manifest(output_path):
+    path = os.path.join(output_path, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except ValueError:
+        print(f"Warning: Ignoring unreadable manifest {path}")
+        return {}
+
+
+def save_manifest(output_path, manifest):
+    path = os.path.join(output_path, MANIFEST_NAME)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def create_hybrid_dataset(
+    food101_path="../data/food-101/images",
+    food5k_path="../data/Food-5k",
+    output_path="../data/hybrid_dataset",
+    mode="copy",
+    workers=16,
+    images_per_category=1000,
+):
+    """
+    Build (or bring up to date) the hybrid dataset. A manifest records the
+    source, size, mtime, hash and split of every file placed, so a re-run
+    only places files whose source is new or changed. The hash is only
+    computed for sources whose size or mtime changed, and one with the same
+    content as before (e.g. only touched) is not placed again. Any other
+    file in the split directories is removed.
+    """
+    # Create directory structure
+    for split in SPLITS:
+        for label in ("healthy_food", "non_food", "unhealthy_food"):
+            os.makedirs(os.path.join(output_path, split, label), exist_ok=True)
+
+    plan = plan_files(food101_path, food5k_path, images_per_category)
+    previous = load_manifest(output_path)
+
+    manifest = {}
+    lock = threading.Lock()
+    counts = {"placed": 0, "unchanged": 0, "failed": 0}
+    # Bounded so planning never runs far ahead of the workers
+    tasks = queue.Queue(maxsize=workers * 4)
+
+    def work():
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            rel_path, src, split, stat = task
+            dst = os.path.join(output_path, rel_path)
+            try:
+                entry = {
+                    "src": src,
+                    "size": stat.st_size,
+                    "mtime": stat.st_mtime,
+                    "hash": file_hash(src),
+                    "split": split,
+                }
+                old = previous.get(rel_path)
+                if (
+                    old is not None
+                    and old["src"] == src
+                    and old.get("hash") == entry["hash"]
+                    and os.path.exists(dst)
+                ):
+                    result = "unchanged"
+                else:
+                    place_file(src, dst, mode)
+                    result = "placed"
+            except Exception as e:
+                # Any error is recorded, so that no worker dies and leaves
+                # the planning loop blocked on the full queue
+                print(f"Error placing {src}: {e}", file=sys.stderr)
+                entry, result = None, "failed"
+            with lock:
+                counts[result] += 1
+                if entry is not None:
+                    manifest[rel_path] = entry
+
+    threads = [threading.Thread(target=work, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    print(f"\nPlacing {len(plan)} images ({mode}, {workers} workers)...")
+    for rel_path, (src, split) in plan.items():
+        try:
+            stat = os.stat(src)
+        except OSError as e:
+            # E.g. removed since it was planned
+            print(f"Error placing {src}: {e}", file=sys.stderr)
+            with lock:
+                counts["failed"] += 1
+            continue
+        entry = previous.get(rel_path)
+        if (
+            entry is not None
+            and entry["src"] == src
+            and entry["size"] == stat.st_size
+            and entry["mtime"] == stat.st_mtime
+            and os.path.exists(os.path.join(output_path, rel_path))
+        ):
+            with lock:
+                counts["unchanged"] += 1
+                manifest[rel_path] = entry
             continue
+        tasks.put((rel_path, src, split, stat))
 
-        images = [f for f in os.listdir(category_path) if f.endswith(".jpg")]
-        images = images[:total_images_per_category]
-
-        num_images = len(images)
-        train_size = int(num_images * 0.7)
-        val_size = int(num_images * 0.15)
-
-        train_images = images[:train_size]
-        val_images = images[train_size : train_size + val_size]
-        test_images = images[train_size + val_size :]
-
-        # Copy to respective splits in unhealthy_food directory
-        for split_info in [
-            ("training", train_images),
-            ("validation", val_images),
-            ("evaluation", test_images),
-        ]:
-            split_name, split_images = split_info
-            for img in split_images:
-                shutil.copy2(
-                    os.path.join(category_path, img),
-                    os.path.join(
-                        output_path, split_name, "unhealthy_food", f"{category}_{img}"
-                    ),
-                )
+    for _ in threads:
+        tasks.put(None)
+    for thread in threads:
+        thread.join()
+
+    # Every other file in the split directories: from an earlier run, e.g. a
+    # category dropped from the lists above, or from a tree built before the
+    # manifest existed, whose files may sit in another split than planned
+    removed = 0
+    for split in SPLITS:
+        for label in ("healthy_food", "non_food", "unhealthy_food"):
+            rel_dir = os.path.join(split, label)
+            for name in os.listdir(os.path.join(output_path, rel_dir)):
+                if os.path.join(rel_dir, name) not in plan:
+                    os.remove(os.path.join(output_path, rel_dir, name))
+                    removed += 1
+
+    save_manifest(output_path, manifest)
+    print(
+        f"Placed {counts['placed']}, unchanged {counts['unchanged']}, "
+        f"removed {removed}, failed {counts['failed']}"
+    )
 
     # Print final dataset statistics
     print("\nFinal Dataset Statistics:")
-    for split in ["training", "validation", "evaluation"]:
-        healthy_count = len(
-            os.listdir(os.path.join(output_path, split, "healthy_food"))
-        )
-        non_food_count = len(os.listdir(os.path.join(output_path, split, "non_food")))
-        unhealthy_count = len(
-            os.listdir(os.path.join(output_path, split, "unhealthy_food"))
-        )
+    for split in SPLITS:
+        labels = [
+            os.path.basename(os.path.dirname(rel_path))
+            for rel_path, entry in manifest.items()
+            if entry["split"] == split
+        ]
+        healthy_count = labels.count("healthy_food")
+        non_food_count = labels.count("non_food")
+        unhealthy_count = labels.count("unhealthy_food")
         print(f"\n{split.capitalize()} set:")
         print(f"Healthy food images: {healthy_count}")
         print(f"Non-food images: {non_food_count}")
@@ -186,7 +352,33 @@ def create_hybrid_dataset():
         print(f"Total: {healthy_count + non_food_count + unhealthy_count}")
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build the hybrid dataset")
+    parser.add_argument("--food101", default="../data/food-101/images")
+    parser.add_argument("--food5k", default="../data/Food-5k")
+    parser.add_argument("--output", default="../data/hybrid_dataset")
+    parser.add_argument(
+        "--mode",
+        choices=["copy", "hardlink", "reflink"],
+        default="copy",
+        help="hardlink and reflink share the source's bytes instead of copying "
+        "them (hardlinked files must not be edited in place); both fall back "
+        "to copying where the filesystem does not support them",
+    )
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--images-per-category", type=int, default=1000)
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
+    args = parse_args()
     print("Creating hybrid dataset...")
-    create_hybrid_dataset()
+    create_hybrid_dataset(
+        args.food101,
+        args.food5k,
+        args.output,
+        args.mode,
+        args.workers,
+        args.images_per_category,
+    )
     print("\nDone!")
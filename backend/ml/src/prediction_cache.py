@@ -0,0 +1,168 @@
+# prediction_cache.py
+import copy
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+CACHE_MODES = ["exact", "perceptual"]
+
+
+def content_key(image_bytes) -> str:
+    """Key for byte-identical images"""
+    return "sha256:" + hashlib.sha256(image_bytes).hexdigest()
+
+
+def perceptual_key(image) -> str:
+    """
+    64-bit difference hash of a PIL image. Re-encodes, recompression and small
+    resizes of the same photo almost always produce the same hash.
+    """
+    from PIL import Image
+
+    pixels = np.asarray(
+        image.convert("L").resize((9, 8), Image.BILINEAR), dtype=np.int16
+    )
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return "dhash:" + np.packbits(bits).tobytes().hex()
+
+
+def model_fingerprint(model_path: str) -> str:
+    """Identify a model file by path, size and modification time"""
+    stat = os.stat(model_path)
+    return f"{os.path.abspath(model_path)}:{stat.st_size}:{int(stat.st_mtime)}"
+
+
+class PredictionCache:
+    """
+    Bounded prediction cache with LRU and TTL eviction.
+
+    Entries are keyed by image content, so a resubmitted photo skips the
+    forward pass. When persist_path is set the cache is loaded from that file
+    at start and written back by save(). The file records which model filled
+    it, so results from a different model are never reused.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        ttl_seconds: float = 3600.0,
+        mode: str = "exact",
+        persist_path: str = None,
+        model_id: str = "",
+    ):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode: {mode}")
+
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.mode = mode
+        self.persist_path = persist_path
+        self.model_id = model_id
+
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if persist_path and os.path.exists(persist_path):
+            self.load()
+
+    def _expired(self, stored_at: float, now: float) -> bool:
+        return self.ttl > 0 and now - stored_at > self.ttl
+
+    def get(self, *keys: str, count_miss: bool = True):
+        """
+        Return a copy of the result cached under the first live key, or None.
+        Counts one hit or miss however many keys are tried; pass
+        count_miss=False when a miss will be retried with another key.
+        """
+        now = time.time()
+        with self.lock:
+            for key in keys:
+                entry = self.entries.get(key)
+                if entry is None:
+                    continue
+                if self._expired(entry[0], now):
+                    del self.entries[key]
+                    continue
+
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(entry[1])
+
+            if count_miss:
+                self.misses += 1
+            return None
+
+    def put(self, keys, result: dict):
+        """Cache result under each of keys"""
+        now = time.time()
+        with self.lock:
+            for key in keys:
+                self.entries[key] = (now, copy.deepcopy(result))
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "mode": self.mode,
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def load(self):
+        """Load unexpired entries written by a previous save()"""
+        try:
+            with open(self.persist_path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(
+                f"Warning: Could not read cache file {self.persist_path}: {e}",
+                file=sys.stderr,
+            )
+            return
+
+        if data.get("model_id") != self.model_id or data.get("mode") != self.mode:
+            print(
+                f"Ignoring cache file {self.persist_path} from another model",
+                file=sys.stderr,
+            )
+            return
+
+        now = time.time()
+        with self.lock:
+            for key, stored_at, result in data.get("entries", []):
+                if not self._expired(stored_at, now):
+                    self.entries[key] = (stored_at, result)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def save(self):
+        """Atomically write the cache to persist_path, oldest entries first"""
+        if not self.persist_path:
+            return
+
+        with self.lock:
+            entries = [
+                [key, stored_at, result]
+                for key, (stored_at, result) in self.entries.items()
+            ]
+
+        tmp_path = self.persist_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {"model_id": self.model_id, "mode": self.mode, "entries": entries}, f
+            )
+        os.replace(tmp_path, self.persist_path)
@@ -0,0 +1,71 @@
+# preprocessing.py
+import io
+import os
+
+import numpy as np
+
+# Multiply rather than divide, in float32 from the start (no float64 copy)
+SCALE = np.float32(1.0 / 255.0)
+
+
+def open_image(source, draft_size=None):
+    """
+    Open an image as RGB, raising on failure. source is a file path or the raw
+    encoded bytes, which are decoded from memory without a temporary file.
+
+    With draft_size (height, width), JPEGs are decoded with DCT scaling to the
+    smallest power-of-two reduction that is still at least that large, so a
+    12MP photo is never fully decoded just to be shrunk to 224px.
+    """
+    # Deferred: only callers that actually decode an image pay for PIL
+    from PIL import Image
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        image = Image.open(io.BytesIO(source))
+    else:
+        if not os.path.exists(source):
+            raise FileNotFoundError(f"Image file not found at {source}")
+        image = Image.open(source)
+
+    if draft_size is not None and image.format == "JPEG":
+        image.draft("RGB", (draft_size[1], draft_size[0]))
+    return image.convert("RGB")
+
+
+def to_uint8(image, size=(224, 224)) -> np.ndarray:
+    """Resize a PIL image to size (height, width) as a uint8 (h, w, 3) array"""
+    from PIL import Image
+
+    if image.size != (size[1], size[0]):
+        image = image.resize((size[1], size[0]), Image.BICUBIC)
+    return np.asarray(image, dtype=np.uint8)
+
+
+def load_image(source, size=(224, 224), draft=True) -> np.ndarray:
+    """Decode and resize an image to a uint8 (h, w, 3) array"""
+    return to_uint8(open_image(source, size if draft else None), size)
+
+
+def normalize(images: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    """Cast uint8 pixels to float32 in [0, 1] in a single pass"""
+    return np.multiply(images, SCALE, out=out, dtype=np.float32)
+
+
+class BatchBuffer:
+    """
+    Preallocated float32 batch that uint8 images are normalized into, so
+    assembling a batch allocates nothing. fill() returns a view that is only
+    valid until the next fill().
+    """
+
+    def __init__(self, max_batch_size: int, size=(224, 224)):
+        self.buffer = np.empty((max_batch_size, size[0], size[1], 3), np.float32)
+
+    def fill(self, images) -> np.ndarray:
+        if len(images) > len(self.buffer):
+            raise ValueError(
+                f"Batch of {len(images)} exceeds buffer of {len(self.buffer)}"
+            )
+        for slot, image in zip(self.buffer, images):
+            normalize(image, out=slot)
+        return self.buffer[: len(images)]
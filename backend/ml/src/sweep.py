@@ -0,0 +1,321 @@
+# sweep.py
+"""
+Hyperparameter sweep over create_model_with_fine_tuning with successive
+halving: every trial trains for --min-epochs, the best 1/eta of them continue
+(resuming from their checkpoint) to eta times as many epochs, and so on up
+to --max-epochs.
+
+Trials run concurrently as separate processes, each pinned to its share of
+the CPUs with matching thread limits. They all read the same decoded-image
+cache (or the pre-resized shards), built once before any trial starts. The
+supervisor collects every trial's results into one CSV.
+
+The search space is a JSON object of parameter lists, e.g.
+    {"fine_tune_layers": [0, 30, 60], "dense_units": [[256, 128], [128]],
+     "dropout": [0.2, 0.4], "learning_rate": [1e-4, 3e-4],
+     "batch_size": [32]}
+Every combination is tried, or --samples random ones.
+
+Usage: python sweep.py --space space.json --output ../sweeps/run1
+           [--parallel 4] [--min-epochs 1] [--max-epochs 9] [--eta 3]
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+from worker_pool import plan_cpus
+
+MODEL_PARAMS = ("fine_tune_layers", "dense_units", "dropout", "learning_rate")
+
+
+def expand_space(space, samples=0, seed=0):
+    """List of trial configs: the full grid, or samples random points of it"""
+    names = sorted(space)
+    grid = [
+        dict(zip(names, values))
+        for values in itertools.product(*(space[name] for name in names))
+    ]
+    if samples and samples < len(grid):
+        grid = random.Random(seed).sample(grid, samples)
+    return grid
+
+
+def read_json(path, default=None):
+    if not os.path.exists(path):
+        return default
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_json(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def run_trial(trial_dir, epochs, cpus=None):
+    """
+    Train one trial up to epochs total, resuming from its checkpoint, and
+    write result.json. Runs in its own process.
+    """
+    import train
+
+    if cpus:
+        os.sched_setaffinity(0, {int(cpu) for cpu in cpus.split(",")})
+
+    import tensorflow as tf
+
+    from callbacks import ThroughputCallback
+    from model import create_model_with_fine_tuning
+
+    if cpus:
+        tf.config.threading.set_intra_op_parallelism_threads(len(cpus.split(",")))
+        tf.config.threading.set_inter_op_parallelism_threads(2)
+
+    config = read_json(os.path.join(trial_dir, "config.json"))
+    checkpoint_path = os.path.join(trial_dir, "checkpoint.h5")
+    result_path = os.path.join(trial_dir, "result.json")
+    result = read_json(result_path, {"epochs": 0, "history": {}, "seconds": 0.0})
+
+    batch_size = config.get("batch_size", train.BATCH_SIZE)
+    dataset = train.load_food_dataset(train.IMG_SIZE, batch_size)
+    train_ds = dataset.create_dataset(
+        "training", train.cache_file("training", train.IMG_SIZE)
+    )
+    val_ds = dataset.create_dataset(
+        "validation", train.cache_file("validation", train.IMG_SIZE)
+    )
+
+    if result["epochs"] and os.path.exists(checkpoint_path):
+        # Includes the optimizer state, so training continues seamlessly
+        model = tf.keras.models.load_model(checkpoint_path)
+    else:
+        model = create_model_with_fine_tuning(
+            (*train.IMG_SIZE, 3),
+            **{name: config[name] for name in MODEL_PARAMS if name in config},
+        )
+
+    throughput = ThroughputCallback(batch_size, dataset.count_images("training"))
+    start = time.perf_counter()
+    history = model.fit(
+        train_ds,
+        validation_data=val_ds,
+        initial_epoch=result["epochs"],
+        epochs=epochs,
+        callbacks=[throughput],
+        class_weight=dataset.get_class_weights("training"),
+        verbose=2,
+    )
+    model.save(checkpoint_path)
+
+    for key, values in history.history.items():
+        result["history"].setdefault(key, []).extend(float(v) for v in values)
+    result["epochs"] = epochs
+    result["seconds"] += time.perf_counter() - start
+    result["images_per_sec"] = throughput.steady_rate()
+    result["val_accuracy"] = max(result["history"]["val_accuracy"])
+    result["val_loss"] = min(result["history"]["val_loss"])
+    write_json(result_path, result)
+
+
+def prepare_input_cache():
+    """
+    Decode every image once into the cache files all trials share, so that
+    no two trials write the same cache
+    """
+    import train
+
+    dataset = train.load_food_dataset(train.IMG_SIZE, train.BATCH_SIZE)
+    if dataset.shard_dir:
+        return  # The shards already are the decoded images
+
+    os.makedirs(train.CACHE_DIR, exist_ok=True)
+    for split in ("training", "validation"):
+        path = train.cache_file(split, train.IMG_SIZE)
+        if os.path.exists(f"{dataset.cache_path(split, path)}.index"):
+            continue
+        print(f"Building the shared {split} cache at {path}...")
+        for _ in dataset.create_dataset(split, path, augment=False):
+            pass
+
+
+class Sweep:
+    """Successive-halving supervisor for trial processes"""
+
+    def __init__(self, configs, output_dir, parallel, min_epochs, max_epochs, eta):
+        self.configs = configs
+        self.output_dir = output_dir
+        self.parallel = parallel
+        self.min_epochs = min_epochs
+        self.max_epochs = max_epochs
+        self.eta = eta
+        self.cpu_plan = plan_cpus(parallel, pin=True)
+        self.results_path = os.path.join(output_dir, "results.csv")
+
+    def trial_dir(self, trial):
+        return os.path.join(self.output_dir, f"trial_{trial:03d}")
+
+    def rungs(self):
+        """Epoch budgets: min_epochs, min_epochs * eta, ..., max_epochs"""
+        budgets = [self.min_epochs]
+        while budgets[-1] < self.max_epochs:
+            budgets.append(min(budgets[-1] * self.eta, self.max_epochs))
+        return budgets
+
+    def run_rung(self, trials, epochs):
+        """Run trials up to epochs, at most parallel at a time"""
+        pending = [
+            trial
+            for trial in trials
+            if read_json(
+                os.path.join(self.trial_dir(trial), "result.json"), {"epochs": 0}
+            )["epochs"]
+            < epochs
+        ]
+        free_slots = list(range(self.parallel))
+        running = {}
+
+        while pending or running:
+            while pending and free_slots:
+                trial, slot = pending.pop(0), free_slots.pop(0)
+                cpus = ",".join(str(cpu) for cpu in self.cpu_plan[slot])
+                threads = str(len(self.cpu_plan[slot]))
+                env = dict(
+                    os.environ,
+                    OMP_NUM_THREADS=threads,
+                    TF_NUM_INTRAOP_THREADS=threads,
+                    TF_NUM_INTEROP_THREADS="2",
+                )
+                command = [sys.executable, os.path.abspath(__file__)]
+                command += ["--trial", self.trial_dir(trial)]
+                command += ["--epochs", str(epochs), "--cpus", cpus]
+                log = open(os.path.join(self.trial_dir(trial), "log.txt"), "a")
+                process = subprocess.Popen(
+                    command, env=env, stdout=log, stderr=subprocess.STDOUT
+                )
+                running[trial] = (process, slot, log)
+                print(f"Trial {trial}: training to {epochs} epochs on CPUs {cpus}")
+
+            time.sleep(1.0)
+            for trial, (process, slot, log) in list(running.items()):
+                code = process.poll()
+                if code is None:
+                    continue
+                log.close()
+                del running[trial]
+                free_slots.append(slot)
+                if code != 0:
+                    print(f"Trial {trial} failed with code {code}, see its log.txt")
+
+    def score(self, trial, epochs):
+        result = read_json(os.path.join(self.trial_dir(trial), "result.json"))
+        if result is None or result["epochs"] < epochs:
+            return None
+        return result
+
+    def write_results(self, rung_of):
+        """One row per trial, at the last rung it reached"""
+        fields = ["trial", "rung", "epochs", "status", *sorted(self.configs[0])]
+        fields += ["val_accuracy", "val_loss", "images_per_sec", "seconds"]
+
+        tmp_path = f"{self.results_path}.tmp"
+        with open(tmp_path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            for trial, config in enumerate(self.configs):
+                result = read_json(os.path.join(self.trial_dir(trial), "result.json"))
+                row = {"trial": trial, "rung": rung_of.get(trial, 0)}
+                row.update({name: json.dumps(value) for name, value in config.items()})
+                if result is None:
+                    row["status"] = "failed"
+                else:
+                    row["status"] = "ok"
+                    for key in ("epochs", "val_accuracy", "val_loss"):
+                        row[key] = result[key]
+                    row["images_per_sec"] = round(result["images_per_sec"], 1)
+                    row["seconds"] = round(result["seconds"], 1)
+                writer.writerow(row)
+        os.replace(tmp_path, self.results_path)
+
+    def run(self):
+        for trial, config in enumerate(self.configs):
+            os.makedirs(self.trial_dir(trial), exist_ok=True)
+            write_json(os.path.join(self.trial_dir(trial), "config.json"), config)
+
+        trials = list(range(len(self.configs)))
+        rung_of = {}
+        for rung, epochs in enumerate(self.rungs()):
+            print(f"\nRung {rung}: {len(trials)} trials to {epochs} epochs")
+            self.run_rung(trials, epochs)
+            for trial in trials:
+                rung_of[trial] = rung
+            self.write_results(rung_of)
+
+            scored = [
+                (result["val_accuracy"], trial)
+                for trial in trials
+                for result in [self.score(trial, epochs)]
+                if result is not None
+            ]
+            scored.sort(reverse=True)
+            keep = max(1, len(scored) // self.eta)
+            trials = [trial for _, trial in scored[:keep]]
+
+        print(f"\nResults written to {self.results_path}")
+        if trials:
+            best = trials[0]
+            print(f"Best trial {best}: {self.configs[best]}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Hyperparameter sweep")
+    parser.add_argument("--space", help="Search space JSON file")
+    parser.add_argument("--output", default="../sweeps/latest")
+    parser.add_argument("--samples", type=int, default=0, help="Default: full grid")
+    parser.add_argument("--parallel", type=int, default=4)
+    parser.add_argument("--min-epochs", type=int, default=1)
+    parser.add_argument("--max-epochs", type=int, default=9)
+    parser.add_argument("--eta", type=int, default=3)
+
+    # Internal: run one trial (used by the supervisor)
+    parser.add_argument("--trial", help=argparse.SUPPRESS)
+    parser.add_argument("--epochs", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--cpus", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.trial:
+        run_trial(args.trial, args.epochs, args.cpus)
+        return
+
+    if not args.space:
+        raise ValueError("--space is required")
+    if args.eta < 2:
+        raise ValueError("--eta must be at least 2")
+
+    configs = expand_space(read_json(args.space), args.samples)
+    os.makedirs(args.output, exist_ok=True)
+
+    # Same sampled configs on a re-run, so finished trials are reused
+    saved = read_json(os.path.join(args.output, "space.json"))
+    if saved is not None and saved != configs:
+        raise ValueError(f"{args.output} holds a sweep over another search space")
+    write_json(os.path.join(args.output, "space.json"), configs)
+
+    prepare_input_cache()
+    Sweep(
+        configs, args.output, args.parallel, args.min_epochs, args.max_epochs, args.eta
+    ).run()
+
+
+if __name__ == "__main__":
+    main()
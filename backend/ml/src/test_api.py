@@ -1,16 +1,14 @@
 # test_api.py
-import tensorflow as tf
 import numpy as np
 from PIL import Image
 import os
 
 
 def load_and_preprocess_image(image_path):
-    """Load and preprocess a single image"""
-    img = Image.open(image_path)
+    """Load and preprocess a single image, as RGB so that images stack"""
+    img = Image.open(image_path).convert("RGB")
     img = img.resize((224, 224))
-    img_array = np.array(img) / 255.0
-    img_array = np.expand_dims(img_array, 0)
+    img_array = np.array(img, dtype=np.float32) / 255.0
     return img_array
 
 
@@ -19,8 +17,10 @@ def test_images():
     # Categories
     CATEGORIES = ["non_food", "food", "junk_food"]
 
-    # Load model
+    # Load model; TensorFlow is only imported once it is needed
     print("Loading model...")
+    import tensorflow as tf
+
     model_path = "../model/model_latest.h5"
     try:
         model = tf.keras.models.load_model(model_path)
@@ -37,41 +37,45 @@ def test_images():
     print("\nTesting images...")
     print("=" * 50)
 
-    results = []
+    # Images that fail to load are reported and left out of the batch
+    loaded, arrays = [], []
     for image_name in test_images:
-        image_path = os.path.join(test_dir, image_name)
         try:
-            # Process image
-            img_array = load_and_preprocess_image(image_path)
-
-            # Get predictions
-            predictions = model.predict(img_array, verbose=0)[0]
-            predicted_class = np.argmax(predictions)
-            confidence = predictions[predicted_class]
-
-            # Store results
-            result = {
-                "image": image_name,
-                "predicted": CATEGORIES[predicted_class],
-                "confidence": confidence,
-                "probabilities": {
-                    cat: float(prob) for cat, prob in zip(CATEGORIES, predictions)
-                },
-            }
-            results.append(result)
-
-            # Print results
-            print(f"\nImage: {image_name}")
-            print(f"Predicted: {result['predicted']}")
-            print(f"Confidence: {confidence:.4f}")
-            print("Probabilities:")
-            for cat, prob in result["probabilities"].items():
-                print(f"  {cat}: {prob:.4f}")
-            print("-" * 50)
-
+            arrays.append(load_and_preprocess_image(os.path.join(test_dir, image_name)))
+            loaded.append(image_name)
         except Exception as e:
             print(f"Error processing {image_name}: {e}")
 
+    # Get predictions for all images in one batch
+    all_predictions = []
+    if arrays:
+        all_predictions = np.asarray(model.predict_on_batch(np.stack(arrays)))
+
+    results = []
+    for image_name, predictions in zip(loaded, all_predictions):
+        predicted_class = np.argmax(predictions)
+        confidence = predictions[predicted_class]
+
+        # Store results
+        result = {
+            "image": image_name,
+            "predicted": CATEGORIES[predicted_class],
+            "confidence": confidence,
+            "probabilities": {
+                cat: float(prob) for cat, prob in zip(CATEGORIES, predictions)
+            },
+        }
+        results.append(result)
+
+        # Print results
+        print(f"\nImage: {image_name}")
+        print(f"Predicted: {result['predicted']}")
+        print(f"Confidence: {confidence:.4f}")
+        print("Probabilities:")
+        for cat, prob in result["probabilities"].items():
+            print(f"  {cat}: {prob:.4f}")
+        print("-" * 50)
+
     # Print summary
     print("\nSummary:")
     for category in CATEGORIES:
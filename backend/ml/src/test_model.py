@@ -1,5 +1,4 @@
 # test_model.py
-import tensorflow as tf
 import numpy as np
 from PIL import Image
 import os
@@ -7,20 +6,20 @@ import random
 
 
 def load_and_preprocess_image(image_path):
-    # Load image
-    img = Image.open(image_path)
+    # Load image, as RGB so that all images stack into one batch
+    img = Image.open(image_path).convert("RGB")
     # Resize to match model's expected input
     img = img.resize((224, 224))
     # Convert to array and normalize
-    img_array = np.array(img) / 255.0
-    # Add batch dimension
-    img_array = np.expand_dims(img_array, 0)
+    img_array = np.array(img, dtype=np.float32) / 255.0
     return img_array
 
 
 def test_model():
-    # Load the trained model
+    # Load the trained model; TensorFlow is only imported once it is needed
     print("Loading model...")
+    import tensorflow as tf
+
     model = tf.keras.models.load_model("../model_final.h5")
 
     # Print model summary
@@ -46,13 +45,27 @@ def test_model():
 
     categories = ["Non-Food", "Healthy Food", "Unhealthy Food"]
 
-    def test_category(images, directory, category_name):
+    tests = [
+        (healthy_food_images, healthy_food_dir, "Healthy Food"),
+        (non_food_images, non_food_dir, "Non-Food"),
+        (unhealthy_food_images, unhealthy_food_dir, "Unhealthy Food"),
+    ]
+
+    # All images go through the model in one batch
+    batch = np.stack(
+        [
+            load_and_preprocess_image(os.path.join(directory, img_name))
+            for images, directory, _ in tests
+            for img_name in images
+        ]
+    )
+    all_predictions = iter(np.asarray(model.predict_on_batch(batch)))
+
+    def test_category(images, category_name):
         print(f"\nTesting {category_name} Images:")
         print("=" * 50)
         for img_name in images:
-            img_path = os.path.join(directory, img_name)
-            img_array = load_and_preprocess_image(img_path)
-            predictions = model.predict(img_array, verbose=0)[0]
+            predictions = next(all_predictions)
 
             predicted_class = np.argmax(predictions)
             confidence = predictions[predicted_class]
@@ -66,9 +79,8 @@ def test_model():
             print("-" * 50)
 
     # Test all categories
-    test_category(healthy_food_images, healthy_food_dir, "Healthy Food")
-    test_category(non_food_images, non_food_dir, "Non-Food")
-    test_category(unhealthy_food_images, unhealthy_food_dir, "Unhealthy Food")
+    for images, _, category_name in tests:
+        test_category(images, category_name)
 
 
 if __name__ == "__main__":
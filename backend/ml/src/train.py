@@ -1,9 +1,47 @@
 # train.py
+import argparse
+import json
+import socket
+import subprocess
+import sys
+import time
 import tensorflow as tf
 from tensorflow.keras import layers, models
+from callbacks import ProfilerCallback, ThroughputCallback
 from dataset import FoodDataset
+from distillation import (
+    DistillationLoss,
+    label_accuracy,
+    teacher_log_probs,
+    with_softmax,
+)
+from embeddings import extract_features, train_head
+from model import (
+    assemble_model,
+    create_feature_extractor,
+    create_head,
+    create_model_with_fine_tuning,
+    create_student,
+)
+from worker_pool import plan_cpus
 import os
 import shutil
+import tempfile
+
+# Configuration
+DATA_DIR = "../data/hybrid_dataset"
+# Pre-resized shards from build_shards.py, used when they have been built
+SHARD_DIR = "../data/hybrid_shards"
+# Decoded uint8 images are cached here after the first epoch
+CACHE_DIR = "../data/cache"
+# Backbone features for --mode head, computed once per backbone and split
+FEATURE_DIR = "../data/features"
+# Teacher for --mode distill, and where its predictions are stored
+TEACHER_PATH = "../model/model_latest.h5"
+TEACHER_DIR = "../data/teacher"
+IMG_SIZE = (224, 224)
+BATCH_SIZE = 32
+EPOCHS = 15
 
 
 def ensure_directories():
@@ -30,40 +68,106 @@ def save_model_with_verification(model, base_path, filename):
     return primary_path, src_path
 
 
-def train():
-    # Configuration
-    DATA_DIR = "../data/hybrid_dataset"
-    IMG_SIZE = (224, 224)
-    BATCH_SIZE = 32
-    EPOCHS = 15
+def cluster_info():
+    """(number of workers, this worker's index) from TF_CONFIG, else (1, 0)"""
+    tf_config = json.loads(os.environ.get("TF_CONFIG", "{}"))
+    num_workers = len(tf_config.get("cluster", {}).get("worker", [])) or 1
+    return num_workers, tf_config.get("task", {}).get("index", 0)
 
-    # Ensure directories exist
-    ensure_directories()
 
-    print(f"Loading data from: {os.path.abspath(DATA_DIR)}")
+def free_ports(count):
+    """Ports that were free a moment ago, for the localhost cluster"""
+    sockets = [socket.socket() for _ in range(count)]
+    try:
+        for sock in sockets:
+            sock.bind(("localhost", 0))
+        return [sock.getsockname()[1] for sock in sockets]
+    finally:
+        for sock in sockets:
+            sock.close()
 
-    # Create datasets
-    dataset = FoodDataset(DATA_DIR, IMG_SIZE, BATCH_SIZE)
-    train_ds = dataset.create_dataset("training")
-    val_ds = dataset.create_dataset("validation")
 
-    # Get class weights
-    class_weights = dataset.get_class_weights("training")
-    print("\nClass weights:", class_weights)
+def launch_workers(num_workers):
+    """
+    Run this script again as num_workers processes on this host, joined into
+    one MultiWorkerMirroredStrategy cluster through TF_CONFIG, each pinned to
+    its own block of CPUs. Returns the first non-zero exit code, or 0.
+    """
+    # Refreshed once here rather than by every worker at the same time
+    dataset = load_food_dataset(IMG_SIZE, BATCH_SIZE)
+    if not dataset.shard_dir:
+        dataset.index.close()
 
-    # Create model
-    print("\nCreating model...")
+    cluster = {"worker": [f"localhost:{port}" for port in free_ports(num_workers)]}
+    processes = []
+    for index, cpus in enumerate(plan_cpus(num_workers, pin=True)):
+        tf_config = {"cluster": cluster, "task": {"type": "worker", "index": index}}
+        env = dict(
+            os.environ, TF_CONFIG=json.dumps(tf_config), OMP_NUM_THREADS=str(len(cpus))
+        )
+        command = [sys.executable, os.path.abspath(__file__), *sys.argv[1:]]
+        command += ["--cpus", ",".join(str(cpu) for cpu in cpus)]
+        processes.append(subprocess.Popen(command, env=env))
+
+    print(f"Launched {num_workers} workers on {', '.join(cluster['worker'])}")
+
+    # Collective ops block forever if a peer dies, so stop everyone then
+    exit_code = 0
+    while processes:
+        for process in list(processes):
+            code = process.poll()
+            if code is None:
+                continue
+            processes.remove(process)
+            if code != 0 and exit_code == 0:
+                exit_code = code
+                print(f"Worker exited with code {code}, stopping the others")
+                for other in processes:
+                    other.terminate()
+        time.sleep(0.5)
+    return exit_code
+
+
+def load_food_dataset(
+    img_size, batch_size, num_workers=1, worker_index=0, refresh=True
+):
+    """FoodDataset over the pre-resized shards when built, else the images"""
+    shard_dir = None
+    if os.path.exists(os.path.join(SHARD_DIR, "training", "meta.json")):
+        shard_dir = SHARD_DIR
+        print(f"Loading data from shards: {os.path.abspath(SHARD_DIR)}")
+    else:
+        print(f"Loading data from: {os.path.abspath(DATA_DIR)}")
+
+    return FoodDataset(
+        DATA_DIR, img_size, batch_size, shard_dir, num_workers, worker_index, refresh
+    )
+
+
+def cache_file(split, img_size, num_workers=1, worker_index=0):
+    """
+    Name of a split's decode cache. FoodDataset.create_dataset adds a
+    fingerprint of the split's file list, so changed images get a new cache.
+    """
+    name = f"{split}_{img_size[0]}"
+    if num_workers > 1:
+        name += f"_{worker_index}of{num_workers}"
+    return os.path.join(CACHE_DIR, name)
+
+
+def create_full_model(img_size):
+    """MobileNetV2 and head trained together end to end"""
     model = models.Sequential(
         [
             tf.keras.applications.MobileNetV2(
-                input_shape=(*IMG_SIZE, 3), include_top=False, weights="imagenet"
+                input_shape=(*img_size, 3), include_top=False, weights="imagenet"
             ),
             layers.GlobalAveragePooling2D(),
             layers.Dense(256, activation="relu"),
             layers.Dropout(0.4),
             layers.Dense(128, activation="relu"),
             layers.Dropout(0.3),
-            layers.Dense(3, activation="softmax"),
+            layers.Dense(3, activation="softmax", dtype="float32"),
         ]
     )
 
@@ -74,39 +178,356 @@ def train():
         metrics=["accuracy"],
     )
 
+    return model
+
+
+def set_precision_policy(mixed_precision):
+    """
+    Set the global Keras dtype policy; must run before the model is built.
+    Output layers are created as float32, so the softmax is never reduced.
+    """
+    policy = "float32" if mixed_precision == "off" else f"mixed_{mixed_precision}"
+    tf.keras.mixed_precision.set_global_policy(policy)
+    return policy
+
+
+def compile_for_training(model, args, metrics=("accuracy",)):
+    """
+    Recompile a model built by one of the factories with loss scaling for
+    float16 (whose small gradients would otherwise underflow) and optionally
+    XLA compilation of the whole training step
+    """
+    optimizer = model.optimizer
+    if args.mixed_precision == "float16" and not isinstance(
+        optimizer, tf.keras.mixed_precision.LossScaleOptimizer
+    ):
+        optimizer = tf.keras.mixed_precision.LossScaleOptimizer(optimizer)
+
+    model.compile(
+        optimizer=optimizer,
+        loss=model.loss,
+        metrics=list(metrics),
+        jit_compile=args.xla,
+    )
+    return model
+
+
+def to_float32(model):
+    """
+    Rebuild a model trained under a mixed-precision policy as pure float32
+    with the same weights, so that serving and conversion are unaffected
+    """
+
+    def reset_dtypes(config):
+        if isinstance(config, dict):
+            return {
+                key: "float32"
+                if key == "dtype" and "mixed" in str(value)
+                else reset_dtypes(value)
+                for key, value in config.items()
+            }
+        if isinstance(config, list):
+            return [reset_dtypes(value) for value in config]
+        return config
+
+    float32_model = model.__class__.from_config(reset_dtypes(model.get_config()))
+    float32_model.set_weights(model.get_weights())
+    float32_model.compile(optimizer="adam", loss=model.loss, metrics=["accuracy"])
+    return float32_model
+
+
+def describe_config(args):
+    precision = "float32" if args.mixed_precision == "off" else args.mixed_precision
+    return f"{args.mode}, {precision}" + (", XLA" if args.xla else "")
+
+
+def create_profiler(args, batch_size, probe_dataset=None, worker_index=None):
+    """ProfilerCallback for --profile, or None"""
+    if not args.profile:
+        return None
+
+    summary_path, trace_dir = args.profile, args.profile_trace
+    if worker_index is not None:
+        root, ext = os.path.splitext(summary_path)
+        summary_path = f"{root}.{worker_index}{ext}"
+        if trace_dir:
+            trace_dir = os.path.join(trace_dir, f"worker{worker_index}")
+    return ProfilerCallback(
+        batch_size,
+        summary_path,
+        probe_dataset,
+        trace_dir=trace_dir,
+        trace_steps=args.profile_steps,
+    )
+
+
+def train_on_images(
+    dataset,
+    model,
+    epochs,
+    extra_callbacks=(),
+    is_chief=True,
+    args=None,
+    soft_targets=None,
+):
+    workers = (dataset.num_workers, dataset.worker_index)
+    soft_targets = soft_targets or {}
+    train_ds = dataset.create_dataset(
+        "training",
+        cache_file("training", dataset.img_size, *workers),
+        soft_targets=soft_targets.get("training"),
+    )
+    val_ds = dataset.create_dataset(
+        "validation",
+        cache_file("validation", dataset.img_size, *workers),
+        soft_targets=soft_targets.get("validation"),
+    )
+
+    # Get class weights
+    class_weights = dataset.get_class_weights("training")
+    print("\nClass weights:", class_weights)
+
+    # Saving a distributed model takes part in collective ops, so every worker
+    # checkpoints, but only the chief's checkpoint is kept. A student keeps
+    # its own, so distilling never replaces the teacher's best model.
+    checkpoint_name = "best_model.h5"
+    if args is not None and args.mode == "distill":
+        checkpoint_name = "best_student.h5"
+    checkpoint_path = os.path.join("checkpoints", checkpoint_name)
+    if not is_chief:
+        checkpoint_path = os.path.join(
+            tempfile.mkdtemp(prefix=f"worker{dataset.worker_index}_"), checkpoint_name
+        )
+
     # Callbacks
     callbacks = [
         tf.keras.callbacks.ModelCheckpoint(
-            filepath="checkpoints/best_model.h5",
+            filepath=checkpoint_path,
             save_best_only=True,
             monitor="val_accuracy",
             mode="max",
-            verbose=1,
+            verbose=1 if is_chief else 0,
         ),
         tf.keras.callbacks.EarlyStopping(
-            monitor="val_accuracy", patience=5, restore_best_weights=True
+            monitor="val_accuracy", mode="max", patience=5, restore_best_weights=True
         ),
         tf.keras.callbacks.ReduceLROnPlateau(
             monitor="val_loss", factor=0.2, patience=3, min_lr=1e-6
         ),
+        *extra_callbacks,
     ]
+    if args is not None and args.profile:
+        # Per worker: every process profiles its own share
+        worker_index = dataset.worker_index if dataset.num_workers > 1 else None
+        callbacks.append(
+            create_profiler(
+                args, dataset.batch_size // dataset.num_workers, train_ds, worker_index
+            )
+        )
 
     # Train model
     print("\nStarting training...")
-    history = model.fit(
-        train_ds,
-        validation_data=val_ds,
-        epochs=EPOCHS,
+    try:
+        return model.fit(
+            train_ds,
+            validation_data=val_ds,
+            epochs=epochs,
+            callbacks=callbacks,
+            class_weight=class_weights,
+            verbose=1,
+        )
+    finally:
+        if not is_chief:
+            shutil.rmtree(os.path.dirname(checkpoint_path), ignore_errors=True)
+
+
+def train_head_on_features(dataset, args):
+    """
+    Train only the head on backbone features computed once per split, then
+    assemble the full image model
+    """
+    feature_extractor = create_feature_extractor((*IMG_SIZE, 3), args.alpha)
+    feature_dir = os.path.join(FEATURE_DIR, feature_extractor.layers[0].name)
+
+    splits = {}
+    for split in ("training", "validation"):
+        splits[split] = extract_features(
+            dataset,
+            feature_extractor,
+            feature_dir,
+            split,
+            cache_file(split, IMG_SIZE),
+            recompute=args.recompute_features,
+        )
+
+    head = create_head(
+        feature_extractor.output_shape[-1],
+        args.hidden_units,
+        args.dropout,
+        args.learning_rate,
+    )
+    compile_for_training(head, args)
+
+    print("\nStarting head training...")
+    train_labels = splits["training"][1]
+    callbacks = [
+        ThroughputCallback(
+            args.head_batch_size, len(train_labels), describe_config(args)
+        )
+    ]
+    profiler = create_profiler(args, args.head_batch_size)
+    if profiler is not None:
+        callbacks.append(profiler)
+
+    history = train_head(
+        head,
+        *splits["training"],
+        *splits["validation"],
+        epochs=args.epochs or 50,
+        batch_size=args.head_batch_size,
         callbacks=callbacks,
-        class_weight=class_weights,
-        verbose=1,
     )
 
+    return history, assemble_model(feature_extractor, head)
+
+
+def train_student(args, config):
+    """
+    Distill the teacher into a small student trained on the images, with the
+    teacher's predictions computed once per split, then add its softmax
+    """
+    teacher = tf.keras.models.load_model(args.teacher, compile=False)
+    teacher_size = tuple(teacher.input_shape[1:3])
+    teacher_dir = os.path.join(
+        TEACHER_DIR, os.path.splitext(os.path.basename(args.teacher))[0]
+    )
+
+    # Teacher targets follow the file order, so both read the images rather
+    # than the shards
+    teacher_dataset = FoodDataset(DATA_DIR, teacher_size, BATCH_SIZE)
+    soft_targets = {
+        split: teacher_log_probs(
+            teacher,
+            args.teacher,
+            teacher_dataset,
+            teacher_dir,
+            split,
+            cache_file(split, teacher_size),
+        )
+        for split in ("training", "validation")
+    }
+    del teacher
+
+    student_size = (args.student_size, args.student_size)
+    dataset = FoodDataset(DATA_DIR, student_size, BATCH_SIZE)
+    student = create_student((*student_size, 3), args.student, args.student_alpha)
+    student.compile(
+        optimizer=tf.keras.optimizers.Adam(learning_rate=args.student_learning_rate),
+        loss=DistillationLoss(
+            temperature=args.temperature, soft_weight=args.soft_weight
+        ),
+    )
+    compile_for_training(student, args, metrics=[label_accuracy()])
+
+    # class_weight takes the argmax of each target row, which is always in
+    # the one-hot part: log-probabilities are never above 0
+    throughput = ThroughputCallback(
+        BATCH_SIZE, dataset.count_images("training"), config
+    )
+    history = train_on_images(
+        dataset,
+        student,
+        args.epochs or EPOCHS,
+        extra_callbacks=[throughput],
+        args=args,
+        soft_targets=soft_targets,
+    )
+
+    return history, with_softmax(student)
+
+
+def model_filename(args):
+    return "student.h5" if args.mode == "distill" else "model.h5"
+
+
+def train(args):
+    num_workers, worker_index = cluster_info()
+    is_chief = worker_index == 0
+    if args.cpus:
+        # Set before TensorFlow starts its thread pools
+        cpus = {int(cpu) for cpu in args.cpus.split(",")}
+        os.sched_setaffinity(0, cpus)
+        tf.config.threading.set_intra_op_parallelism_threads(len(cpus))
+
+    strategy = tf.distribute.get_strategy()
+    if num_workers > 1:
+        if args.mode in ("head", "distill"):
+            raise ValueError("--workers is for the full and fine-tune modes")
+        # Must be created before any other TensorFlow op runs
+        strategy = tf.distribute.MultiWorkerMirroredStrategy()
+
+    # Ensure directories exist
+    if is_chief:
+        ensure_directories()
+
+    # Create datasets. Every worker runs BATCH_SIZE images per step; the
+    # strategy splits each global batch of BATCH_SIZE * num_workers. Workers
+    # use the index as launch_workers refreshed it.
+    dataset = load_food_dataset(
+        IMG_SIZE,
+        BATCH_SIZE * num_workers,
+        num_workers,
+        worker_index,
+        refresh=num_workers == 1,
+    )
+
+    # Create model
+    policy = set_precision_policy(args.mixed_precision)
+    config = describe_config(args)
+    if num_workers > 1:
+        config += f", worker {worker_index + 1}/{num_workers}"
+    print(f"\nCreating model ({config})...")
+    if args.mode == "head":
+        history, model = train_head_on_features(dataset, args)
+    elif args.mode == "distill":
+        history, model = train_student(args, config)
+    else:
+        with strategy.scope():
+            if args.mode == "fine-tune":
+                model = create_model_with_fine_tuning((*IMG_SIZE, 3))
+            else:
+                model = create_full_model(IMG_SIZE)
+            compile_for_training(model, args)
+        throughput = ThroughputCallback(
+            BATCH_SIZE, dataset.count_images("training"), config
+        )
+        history = train_on_images(
+            dataset,
+            model,
+            args.epochs or EPOCHS,
+            extra_callbacks=[throughput],
+            is_chief=is_chief,
+            args=args,
+        )
+
+    if not is_chief:
+        # Matches the chief's final save (see train_on_images)
+        scratch_dir = tempfile.mkdtemp(prefix=f"worker{worker_index}_")
+        try:
+            model.save(os.path.join(scratch_dir, "model.h5"))
+        finally:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+        return history, model
+
+    if policy != "float32":
+        tf.keras.mixed_precision.set_global_policy("float32")
+        model = to_float32(model)
+
     # Save final model with verification
     print("\nSaving final model...")
     try:
         primary_path, src_path = save_model_with_verification(
-            model, "checkpoints", "model.h5"
+            model, "checkpoints", model_filename(args)
         )
         print(f"Model successfully saved and verified at:")
         print(f"1. {primary_path}")
@@ -117,14 +538,111 @@ def train():
     return history, model
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train the food classifier")
+    parser.add_argument(
+        "--mode",
+        choices=["full", "head", "fine-tune", "distill"],
+        default="full",
+        help="full: train backbone and head end to end; head: train only the "
+        "head on precomputed backbone features; fine-tune: unfreeze the top "
+        "backbone layers (create_model_with_fine_tuning); distill: train a "
+        "small student on the labels and a teacher model's predictions, "
+        "saved as student.h5",
+    )
+    parser.add_argument(
+        "--epochs", type=int, help=f"Default {EPOCHS}, or 50 for --mode head"
+    )
+    parser.add_argument(
+        "--mixed-precision",
+        choices=["off", "float16", "bfloat16"],
+        default="off",
+        help="Compute in float16 (GPUs, with loss scaling) or bfloat16 (CPUs "
+        "and TPUs that support it), keeping float32 weights and outputs",
+    )
+    parser.add_argument(
+        "--xla",
+        action="store_true",
+        help="Compile the training step with XLA (jit_compile)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Train data-parallel in this many local processes, each pinned "
+        "to its share of the CPUs and reading its share of the data",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="PATH",
+        help="Write per-epoch step times, images/sec, peak RSS and an input "
+        "pipeline vs compute estimate to this JSON file",
+    )
+    parser.add_argument(
+        "--profile-trace",
+        metavar="DIR",
+        help="With --profile, also record a TensorFlow profiler trace here",
+    )
+    parser.add_argument(
+        "--profile-steps",
+        type=int,
+        nargs=2,
+        default=[10, 20],
+        metavar=("START", "STOP"),
+        help="Training steps to trace, counted across epochs",
+    )
+    # Set by the --workers launcher for each worker process
+    parser.add_argument("--cpus", help=argparse.SUPPRESS)
+
+    head = parser.add_argument_group("head mode")
+    head.add_argument("--alpha", type=float, default=1.0, help="Backbone width")
+    head.add_argument("--hidden-units", type=int, nargs="*", default=[128])
+    head.add_argument("--dropout", type=float, default=0.2)
+    head.add_argument("--learning-rate", type=float, default=1e-3)
+    head.add_argument("--head-batch-size", type=int, default=256)
+    head.add_argument(
+        "--recompute-features",
+        action="store_true",
+        help="Run the backbone again even if features are stored",
+    )
+
+    distill = parser.add_argument_group("distill mode")
+    distill.add_argument("--teacher", default=TEACHER_PATH)
+    distill.add_argument("--student", choices=["mobilenet", "cnn"], default="mobilenet")
+    distill.add_argument(
+        "--student-alpha", type=float, default=0.35, help="MobileNetV2 width"
+    )
+    distill.add_argument("--student-size", type=int, default=128)
+    distill.add_argument("--student-learning-rate", type=float, default=1e-3)
+    distill.add_argument(
+        "--temperature",
+        type=float,
+        default=4.0,
+        help="Softens both models' predictions; higher shows the student "
+        "more of the teacher's ranking of the wrong classes",
+    )
+    distill.add_argument(
+        "--soft-weight",
+        type=float,
+        default=0.9,
+        help="Weight of the teacher's targets against the labels",
+    )
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
+    args = parse_args()
+    if args.workers > 1 and "TF_CONFIG" not in os.environ:
+        sys.exit(launch_workers(args.workers))
+
     print("Starting training process...")
     try:
-        history, model = train()
+        history, model = train(args)
 
         # Verify saved model exists
-        expected_paths = ["checkpoints/model.h5", "src/checkpoints/model.h5"]
-        for path in expected_paths:
+        filename = model_filename(args)
+        expected_paths = [f"checkpoints/{filename}", f"src/checkpoints/{filename}"]
+        for path in expected_paths if cluster_info()[1] == 0 else []:
             if os.path.exists(path):
                 print(f"Verified: Model exists at {path}")
             else:
@@ -132,3 +650,5 @@ if __name__ == "__main__":
 
     except Exception as e:
         print(f"Error during training: {str(e)}")
+        if "TF_CONFIG" in os.environ:
+            sys.exit(1)  # Lets the launcher stop the other workers
@@ -0,0 +1,100 @@
+# validation.py
+"""
+Fast dataset validation. Each image gets a cheap check of its format magic
+and end marker; only files failing that check (or all of them, with
+full_decode) are fully decoded with PIL. FoodDataset.validate_dataset runs
+the checks and keeps the results in the dataset index (dataset_index.py),
+so later runs only check new or changed files and corrupted files are left
+out of training. --rescan (implied by --full) also finds images rewritten in
+place, which the index's quick refresh cannot see.
+
+Usage: python validation.py [--data-dir ../data/hybrid_dataset] [--full]
+           [--rescan]
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+JPEG_MAGIC = b"\xff\xd8\xff"
+JPEG_END = b"\xff\xd9"
+PNG_MAGIC = b"\x89PNG\r\n\x1a\n"
+PNG_END = b"IEND\xaeB`\x82"
+
+# End markers are looked for this far from the end, since some encoders pad
+TRAILER_BYTES = 1024
+
+
+def check_image(path, full_decode=False):
+    """
+    Check one image file.
+
+    Returns:
+        (valid, detail, method): detail is the format or the failure reason,
+        method is "header" or "decode" depending on how far the check went
+    """
+    try:
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            header = f.read(len(PNG_MAGIC))
+            f.seek(max(0, size - TRAILER_BYTES))
+            trailer = f.read()
+    except OSError as e:
+        return False, f"unreadable: {e.strerror}", "header"
+
+    if header.startswith(JPEG_MAGIC):
+        image_format, complete = "JPEG", JPEG_END in trailer
+    elif header.startswith(PNG_MAGIC):
+        image_format, complete = "PNG", PNG_END in trailer
+    else:
+        return False, "not a JPEG or PNG", "header"
+
+    if complete and not full_decode:
+        return True, image_format, "header"
+
+    # No end marker (truncated, or unusual trailing data) or a full check
+    # was asked for: only a real decode can tell
+    from PIL import Image
+
+    try:
+        with Image.open(path) as image:
+            image.load()
+    except Exception as e:
+        return False, f"decode failed: {e}", "decode"
+    return True, image_format, "decode"
+
+
+def check_images(paths, workers=None, full_decode=False):
+    """check_image for many files on a process pool, in order"""
+    if not paths:
+        return []
+    check = partial(check_image, full_decode=full_decode)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(check, paths, chunksize=64))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate dataset images")
+    parser.add_argument("--data-dir", default="../data/hybrid_dataset")
+    parser.add_argument("--workers", type=int, help="Default: one per CPU")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Fully decode every image; implies --rescan",
+    )
+    parser.add_argument(
+        "--rescan",
+        action="store_true",
+        help="Rescan every directory, to catch images rewritten in place",
+    )
+    args = parser.parse_args()
+
+    from dataset import FoodDataset
+
+    FoodDataset(args.data_dir).validate_dataset(
+        args.workers, args.full, args.rescan or args.full
+    )
+
+
+if __name__ == "__main__":
+    main()
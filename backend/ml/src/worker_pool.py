@@ -0,0 +1,177 @@
+# worker_pool.py
+import itertools
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import Future
+
+
+class WorkerCrashed(RuntimeError):
+    pass
+
+
+def plan_cpus(workers: int, pin: bool):
+    """
+    Split the CPUs this process may use into one contiguous block per worker.
+    Returns a list of CPU id lists, or Nones when workers are not pinned.
+    """
+    if not pin:
+        return [None] * workers
+
+    cpus = sorted(os.sched_getaffinity(0))
+    per_worker = max(1, len(cpus) // workers)
+    return [
+        [cpus[(index * per_worker + i) % len(cpus)] for i in range(per_worker)]
+        for index in range(workers)
+    ]
+
+
+class Worker:
+    """One model process speaking the JSON-line protocol on stdin/stdout"""
+
+    def __init__(self, index: int, command, on_exit):
+        self.index = index
+        self.command = command
+        self.on_exit = on_exit
+
+        self.pending = {}
+        self.completed = 0
+        self.alive = True
+        self.lock = threading.Lock()
+
+        # stderr is inherited so worker logs reach the supervisor's stderr
+        self.process = subprocess.Popen(
+            command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1
+        )
+        self.reader = threading.Thread(target=self._read_responses, daemon=True)
+        self.reader.start()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self.pending)
+
+    def send(self, request_id: int, request: dict, future: Future):
+        with self.lock:
+            if not self.alive:
+                raise WorkerCrashed(f"Worker {self.index} is not running")
+            self.pending[request_id] = future
+            try:
+                self.process.stdin.write(json.dumps({**request, "id": request_id}))
+                self.process.stdin.write("\n")
+                self.process.stdin.flush()
+            except OSError:
+                del self.pending[request_id]
+                raise WorkerCrashed(f"Worker {self.index} stopped accepting requests")
+
+    def _read_responses(self):
+        for line in self.process.stdout:
+            try:
+                response = json.loads(line)
+            except ValueError:
+                continue
+            with self.lock:
+                future = self.pending.pop(response.pop("id", None), None)
+                self.completed += 1
+            if future is not None:
+                future.set_result(response)
+
+        # stdout closed: the worker exited, on purpose or not
+        with self.lock:
+            self.alive = False
+            pending, self.pending = self.pending, {}
+        for future in pending.values():
+            future.set_exception(
+                WorkerCrashed(f"Worker {self.index} exited mid-request")
+            )
+        self.on_exit(self)
+
+    def stop(self):
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        self.process.wait()
+        self.reader.join()
+
+
+class WorkerPool:
+    """
+    Supervises model worker processes: each request goes to the live worker
+    with the fewest requests in flight, and a worker that dies is restarted.
+    """
+
+    def __init__(self, commands, restart_delay: float = 1.0):
+        """
+        Args:
+            commands: One command line per worker
+            restart_delay: Pause before restarting a crashed worker, so a worker
+                that fails at startup does not spin
+        """
+        self.restart_delay = restart_delay
+        self.lock = threading.Lock()
+        self.request_ids = itertools.count()
+        self.restarts = 0
+        self.closing = False
+        self.workers = [
+            Worker(index, command, self._on_exit)
+            for index, command in enumerate(commands)
+        ]
+
+    def submit(self, request: dict) -> Future:
+        """Send a request to the least-loaded worker; resolves to its response"""
+        future = Future()
+        with self.lock:
+            live = [worker for worker in self.workers if worker.alive]
+            if not live:
+                raise WorkerCrashed("No workers are running")
+            worker = min(live, key=lambda candidate: candidate.in_flight)
+            request_id = next(self.request_ids)
+        worker.send(request_id, request, future)
+        return future
+
+    def _on_exit(self, worker):
+        code = worker.process.wait()
+        if self.closing:
+            return
+
+        print(
+            f"Worker {worker.index} exited with code {code}, restarting",
+            file=sys.stderr,
+        )
+        time.sleep(self.restart_delay)
+        with self.lock:
+            if self.closing:
+                return
+            self.workers[worker.index] = Worker(
+                worker.index, worker.command, self._on_exit
+            )
+            self.restarts += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            workers = list(self.workers)
+            restarts = self.restarts
+        return {
+            "restarts": restarts,
+            "workers": [
+                {
+                    "index": worker.index,
+                    "pid": worker.process.pid,
+                    "alive": worker.alive,
+                    "in_flight": worker.in_flight,
+                    "completed": worker.completed,
+                }
+                for worker in workers
+            ],
+        }
+
+    def close(self):
+        """Let every worker finish its queue and exit"""
+        with self.lock:
+            self.closing = True
+            workers = list(self.workers)
+        for worker in workers:
+            worker.stop()